@@ -3,57 +3,156 @@
 __author__ = "Jonas Lorander"
 __license__ = "Simplified BSD 2-Clause License"
 
-import json
+import time
+
+# Process start, before the heavy imports, the startup timeline is measured from here
+_startTime = time.time()
+
 import os
 import sys
 import pygame
 import pygbutton
-import requests
 import platform
 import datetime
-import subprocess
+import re
+import urllib
 from pygame.locals import *
-from collections import deque
 from ConfigParser import RawConfigParser
+from StringIO import StringIO
+from octoprintapi import OctoPrintSession, sharedSession
+from statepoller import ENDPOINTS, MODES, default_intervals
+from pushclient import PushClient, push_available
+from tempgraph import TempGraph
+from textcache import TextCache
+from backlight import Backlight
+from perfstats import PerfStats
+from temphistory import TempHistoryFile, withGaps
+from printers import Printer
+from widgetregistry import WidgetRegistry
+from framebuffer import FramebufferOutput
+from gpioinput import GpioInput
 
 import RPi.GPIO as GPIO
 
-class OctoPiPanel():
-    """
-    @var done: anything can set to True to forcequit
-    @var screen: points to: pygame.display.get_surface()        
-    """
+# Events that wake up the main loop
+EVENT_STATE     = USEREVENT + 1 # a new printer state snapshot is available
+EVENT_BACKLIGHT = USEREVENT + 2 # backlight timeout expired
+EVENT_COMMAND   = USEREVENT + 3 # a queued command finished, event.printer sent it and event.result is its CommandResult
+EVENT_SAMPLE    = USEREVENT + 4 # time to add a sample to the temperature graph
+EVENT_GPIO      = USEREVENT + 5 # a GPIO edge was queued, or a held button may have become a long press
+
+# Screens, the detail screen shows and controls the selected printer
+SCREEN_OVERVIEW = 'overview'
+SCREEN_DETAIL   = 'detail'
+SCREEN_FILES    = 'files'
+SCREEN_PREVIEW  = 'preview'
+SCREEN_CAMERA   = 'camera'
+
+# Screens showing the temperature graph
+GRAPH_SCREENS = (SCREEN_DETAIL, SCREEN_PREVIEW)
+
+# Time spans the graph can show, tap the graph to switch. None is the whole print.
+GRAPH_ZOOMS = [("10 min", 600), ("1 h", 3600), ("print", None)]
 
-    # Read settings from OctoPiPanel.cfg settings file
-    cfg = RawConfigParser()
-    scriptDirectory = os.path.dirname(os.path.realpath(__file__))
-    settingsFilePath = os.path.join(scriptDirectory, "OctoPiPanel.cfg")
-    cfg.readfp(open(settingsFilePath,"r"))
 
-    api_baseurl = cfg.get('settings', 'baseurl')
-    apikey = cfg.get('settings', 'apikey')
-    updatetime = cfg.getint('settings', 'updatetime')
-    backlightofftime = cfg.getint('settings', 'backlightofftime')
+# Parsed OctoPiPanel.cfg, read once the first time it's needed
+_settings = None
 
-    if cfg.has_option('settings', 'window_width'):
-        win_width = cfg.getint('settings', 'window_width')
+def loadSettings(path):
+    global _settings
+    if _settings is None:
+        _settings = RawConfigParser()
+        with open(path, "r") as settingsFile:
+            _settings.readfp(settingsFile)
+    return _settings
+
+def readPollIntervals(cfg, updatetime):
+    """
+    Poll intervals per endpoint, e.g. "poll_printer = 2000, 5000, 10000"
+    sets ms between polls while active, idle and disconnected. Modes left
+    out keep their default, so "poll_job = 1000" only changes the active one.
+    """
+    intervals = default_intervals(updatetime)
+    for endpoint in ENDPOINTS:
+        option = 'poll_' + endpoint
+        if cfg.has_option('settings', option):
+            try:
+                values = [int(v) for v in cfg.get('settings', option).split(',')]
+            except ValueError:
+                values = []
+            if not 1 <= len(values) <= len(MODES) or min(values) <= 0:
+                raise ValueError("{0} must be up to {1} positive intervals in ms, got '{2}'".format(option, len(MODES), cfg.get('settings', option)))
+            intervals[endpoint].update(zip(MODES, values))
+    return intervals
+
+def readPrinters(cfg, historyfile, filecache):
+    """
+    The printer set up in [settings] plus one for every [printer <name>]
+    section, each with its own baseurl and apikey and optionally pushurl,
+    historyfile, filecache and webcamurl. Returns (name, baseurl, apikey,
+    pushurl, historyfile, filecache, webcamurl) tuples.
+    """
+    if cfg.has_option('settings', 'name'):
+        name = cfg.get('settings', 'name')
     else:
-        win_width = 320
+        name = "OctoPrint"
 
-    if cfg.has_option('settings', 'window_height'):
-        win_height = cfg.getint('settings', 'window_height')
+    if cfg.has_option('settings', 'pushurl'):
+        pushurl = cfg.get('settings', 'pushurl')
     else:
-        win_height = 240
+        pushurl = None
+
+    if cfg.has_option('settings', 'webcamurl'):
+        webcamurl = cfg.get('settings', 'webcamurl')
+    else:
+        webcamurl = None
+
+    printers = [(name, cfg.get('settings', 'baseurl'), cfg.get('settings', 'apikey'), pushurl, historyfile, filecache, webcamurl)]
+
+    for section in cfg.sections():
+        if not section.startswith('printer '):
+            continue
+
+        name = section[len('printer '):].strip()
 
-    addkey = '?apikey={0}'.format(apikey)
-    apiurl_printhead = '{0}/api/printer/printhead'.format(api_baseurl)
-    apiurl_tool = '{0}/api/printer/tool'.format(api_baseurl)
-    apiurl_bed = '{0}/api/printer/bed'.format(api_baseurl)
-    apiurl_job = '{0}/api/job'.format(api_baseurl)
-    apiurl_status = '{0}/api/printer?apikey={1}'.format(api_baseurl, apikey)
-    apiurl_connection = '{0}/api/connection'.format(api_baseurl)
+        if cfg.has_option(section, 'pushurl'):
+            pushurl = cfg.get(section, 'pushurl')
+        else:
+            pushurl = None
+
+        if cfg.has_option(section, 'webcamurl'):
+            webcamurl = cfg.get(section, 'webcamurl')
+        else:
+            webcamurl = None
 
-    #print apiurl_job + addkey
+        suffix = re.sub('[^A-Za-z0-9]+', '_', name)
+
+        if cfg.has_option(section, 'historyfile'):
+            path = cfg.get(section, 'historyfile')
+        else:
+            path = "{0}.{1}".format(historyfile, suffix)
+
+        if cfg.has_option(section, 'filecache'):
+            cachepath = cfg.get(section, 'filecache')
+        else:
+            cachepath = "{0}.{1}".format(filecache, suffix)
+
+        printers.append((name, cfg.get(section, 'baseurl'), cfg.get(section, 'apikey'), pushurl, path, cachepath, webcamurl))
+    return printers
+
+class OctoPiPanel():
+    """
+    @var done: anything can set to True to forcequit
+    @var screen: points to: pygame.display.get_surface(), or the FramebufferOutput surface
+    """
+
+    scriptDirectory = os.path.dirname(os.path.realpath(__file__))
+    settingsFilePath = os.path.join(scriptDirectory, "OctoPiPanel.cfg")
+
+    apipath_printhead = '/api/printer/printhead'
+    apipath_tool = '/api/printer/tool'
+    apipath_bed = '/api/printer/bed'
+    apipath_job = '/api/job'
 
     def __init__(self, caption="OctoPiPanel"):
         """
@@ -62,6 +161,13 @@ class OctoPiPanel():
         self.done = False
         self.color_bg = pygame.Color(41, 61, 70)
 
+        # Startup timeline, phase -> ms
+        self.timeline = [("imports", (time.time() - _startTime) * 1000.0)]
+        self.timeline_mark = time.time()
+
+        self._loadSettings()
+        self._markStartup("settings")
+
         # Button settings
         self.buttonsTop = 25
         self.leftPadding = 5
@@ -88,75 +194,385 @@ class OctoPiPanel():
         self.PrintTimeLeft = 0
         self.Height = 0.0
         self.FileName = "Nothing"
-        self.getstate_ticks = pygame.time.get_ticks()
+        self.FileOrigin = None
+        self.FilePath = None
+        self.FilePos = None
+
+        # Timings of the main loop phases and HTTP requests
+        self.perf = PerfStats()
+
+        # All OctoPrint traffic of all printers goes through one keep-alive connection pool
+        self.pool = sharedSession(len(self.printerSettings))
+
+        if self.usepush and not push_available():
+            print "websocket-client is not installed, polling OctoPrint instead"
+            self.usepush = False
+
+        # Every printer fetches status and sends commands on threads of its own
+        self.printers = []
+        for name, baseurl, apikey, pushurl, historyfile, filecache, webcamurl in self.printerSettings:
+            printer = Printer(name, OctoPrintSession(baseurl, apikey, session=self.pool), self.pollintervals, self.graph_area_width, filecache, self.previewcache, webcamurl)
+            printer.api.perf = self.perf
+            printer.poller.listener = self._state_published
+            printer.files.listener = self._state_published
+            printer.preview.listener = self._state_published
+            printer.webcam.listener = self._state_published
+            printer.webcam.interval = self.webcaminterval / 1000.0
+            printer.webcam.perf = self.perf
+            printer.commands.listener = lambda result, printer=printer: self._command_done(printer, result)
+
+            # Optionally receive state over OctoPrint's push socket instead
+            if self.usepush:
+                printer.setPush(PushClient(printer.api, printer.poller, pushurl))
+
+            # Persistent history on disk, so a restart doesn't wipe the graph
+            self._openHistoryFile(printer, historyfile)
+            self.printers.append(printer)
+
+        # With more than one printer start on the overview screen
+        if len(self.printers) > 1:
+            self.screenName = SCREEN_OVERVIEW
+        else:
+            self.screenName = SCREEN_DETAIL
+        self.overview_rowHeight = 32
+        self.zoom = 0
+        self._selectPrinter(self.printers[0])
 
-        # Lists for temperature data
-        self.HotEndTempList = deque([0] * self.graph_area_width)
-        self.BedTempList = deque([0] * self.graph_area_width)
+        # Scrolling temperature graph, hot end in red and bed in blue
+        self.graph = TempGraph((self.graph_area_width, self.graph_area_height),
+                               [(220, 0, 0), (0, 0, 220)], [(180, 40, 40), (40, 40, 180)])
+        self.graph.rebuild(self.TempHistory)
+        self._markStartup("state")
 
         self.gpioButtons = [18, 27, 22, 23]
 
+        # GPIO edges are queued on RPi.GPIO's thread, their actions run on the main loop
         GPIO.setmode(GPIO.BCM)
+        self.gpio = GpioInput(GPIO, self.gpiodebounce, self.gpiolongpress)
+        self.gpio.perf = self.perf
+        self.gpio.listener = self._gpio_edge
         for io in self.gpioButtons:
-            GPIO.setup(io, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-            GPIO.add_event_detect(io, GPIO.FALLING, callback=self._button_clicked, bouncetime=100)
+            if io == self.gpioButtons[2]:
+                # Holding the start/abort button pauses or resumes a print
+                self.gpio.add(io, lambda io=io: self._button_clicked(io), self._button_held)
+            else:
+                self.gpio.add(io, lambda io=io: self._button_clicked(io))
+        self._markStartup("gpio")
        
         if platform.system() == 'Linux':
-            if subprocess.Popen(["pidof", "X"], stdout=subprocess.PIPE).communicate()[0].strip() == "":
-                # Init framebuffer/touchscreen environment variables
+            if not os.environ.get('DISPLAY') and not os.environ.get('SDL_VIDEODRIVER'):
+                # No X server, init framebuffer/touchscreen environment variables
                 os.putenv('SDL_VIDEODRIVER', 'fbcon')
                 os.putenv('SDL_FBDEV'      , '/dev/fb0')
                 os.putenv('SDL_MOUSEDRV'   , 'TSLIB')
                 os.putenv('SDL_MOUSEDEV'   , '/dev/input/touchscreen')
 
-        # init pygame and set up screen
-        pygame.init()
+        # init only the pygame modules we use and set up screen
+        pygame.display.init()
+        pygame.font.init()
         self.screen = pygame.display.set_mode( (self.win_width, self.win_height) )
         #modes = pygame.display.list_modes(16)
         #self.screen = pygame.display.set_mode(modes[0], FULLSCREEN, 16)
         pygame.display.set_caption( caption )
 
+        # Optionally draw straight into the framebuffer. SDL still delivers the input events.
+        self.framebuffer = None
+        if self.framebufferpath:
+            try:
+                self.framebuffer = FramebufferOutput(self.framebufferpath, (self.win_width, self.win_height), self.framebufferdepth)
+                self.screen = self.framebuffer.surface
+            except (IOError, OSError, ValueError) as e:
+                print "Framebuffer {0} not used: {1}".format(self.framebufferpath, e)
+
         if platform.system() == 'Windows' or platform.system() == 'Darwin':
             pygame.mouse.set_visible(True)
         else:
             pygame.mouse.set_visible(False)
 
-        # Set font
-        #self.fntText = pygame.font.Font("Cyberbit.ttf", 12)
-        self.fntText = pygame.font.Font(os.path.join(self.scriptDirectory, "Cyberbit.ttf"), 12)
-        self.fntText.set_bold(True)
-        self.fntTextSmall = pygame.font.Font(os.path.join(self.scriptDirectory, "Cyberbit.ttf"), 10)
-        self.fntTextSmall.set_bold(True)
+        self._markStartup("display")
+
+        # Set font, other sizes are loaded when first needed
+        self.fonts = {}
+        self.fontData = None
+        self.fntText = self._font(12)
+        self._markStartup("fonts")
+
+        # Rendered texts, shared by all labels
+        self.textCache = TextCache()
 
         # backlight on off status and control
-        self.bglight_ticks = pygame.time.get_ticks()
-        self.bglight_on = True
+        if platform.system() == 'Linux':
+            self.backlight = Backlight()
+        else:
+            self.backlight = Backlight(None)
         
         # First column
         self.btnHomeXY        = self._makeButton(0, 0, "Home X/Y") 
         self.btnHomeZ         = self._makeButton(0, 1, "Home Z") 
         self.btnZUp           = self._makeButton(0, 2, "Z +10") 
         self.btnExtrude       = self._makeButton(0, 3, "Extrude 10");
+        self.btnPreview       = self._makeButton(0, 0, "Preview")
 
         # Second column
         self.btnGetReady      = self._makeButton(1, 0, "Get Ready") 
+        self.btnCamera        = self._makeButton(1, 0, "Camera")
         self.btnHeatHotEnd    = self._makeButton(1, 1, "Heat hot end") 
 
         # Third column
-        self.btnStartPrint    = self._makeButton(2, 0, "Start print") 
+        self.btnStartPrint    = self._makeButton(2, 0, "Start", half=0)
+        self.btnFiles         = self._makeButton(2, 0, "Files", half=1)
         self.btnAbortPrint    = self._makeButton(2, 0, "Abort print", (200, 0, 0)) 
         self.btnPausePrint    = self._makeButton(2, 1, "Pause print") 
         self.btnShutdown      = self._makeButton(2, 1, "Shutdown");
 
-        if platform.system() == 'Linux':
-            os.system("echo '1' > /sys/class/backlight/soc\:backlight/brightness")
+        # Touches reach only the visible button under them, which runs its action
+        self.detailScreen = WidgetRegistry()
+        self.detailScreen.add(self.btnHomeXY, self._home_xy)
+        self.detailScreen.add(self.btnHomeZ, self._home_z)
+        self.detailScreen.add(self.btnZUp, self._z_up)
+        self.detailScreen.add(self.btnExtrude, self._extrude)
+        self.detailScreen.add(self.btnGetReady, self._get_ready)
+        self.detailScreen.add(self.btnHeatHotEnd, self._heat_hotend)
+        self.detailScreen.add(self.btnStartPrint, self._start_print)
+        self.detailScreen.add(self.btnFiles, self._open_files)
+        self.detailScreen.add(self.btnAbortPrint, self._abort_print)
+        self.detailScreen.add(self.btnPausePrint, self._pause_print)
+        self.detailScreen.add(self.btnShutdown, self._shutdown)
+        self.detailScreen.add(self.btnPreview, self._open_preview)
+        self.detailScreen.add(self.btnCamera, self._open_camera)
+
+        # File selection, a scrolling list of the printer's files above a row of buttons
+        filesTop = self.win_height - self.buttonHeight - self.buttonVSpace
+        self.btnFilesUp       = self._makeButton(0, 0, "Up", top=filesTop)
+        self.btnFilesDown     = self._makeButton(1, 0, "Down", top=filesTop)
+        self.btnFilesLoad     = self._makeButton(2, 0, "Load", top=filesTop)
+
+        self.filesScreen = WidgetRegistry()
+        self.filesScreen.add(self.btnFilesUp, self._files_up)
+        self.filesScreen.add(self.btnFilesDown, self._files_down)
+        self.filesScreen.add(self.btnFilesLoad, self._load_file)
+
+        # Overview, as many printers as fit on the screen, paged with Up and Down if there are more
+        self.btnOverviewUp    = self._makeButton(0, 0, "Up", top=filesTop)
+        self.btnOverviewDown  = self._makeButton(2, 0, "Down", top=filesTop)
+
+        self.overviewScreen = WidgetRegistry()
+        self.overviewScreen.add(self.btnOverviewUp, self._overview_up)
+        self.overviewScreen.add(self.btnOverviewDown, self._overview_down)
+
+        self.overview_rows = (self.win_height - self.buttonsTop) // self.overview_rowHeight
+        if len(self.printers) > self.overview_rows:
+            self.overview_rows = (filesTop - self.buttonVSpace - self.buttonsTop) // self.overview_rowHeight
+        self.overviewTop = 0   # index of the first printer shown
+
+        self.file_rowHeight = 18
+        self.file_rect = pygame.Rect(self.leftPadding, self.buttonsTop, self.win_width - 2 * self.leftPadding, filesTop - self.buttonVSpace - self.buttonsTop)
+        self.file_rows = self.file_rect.height / self.file_rowHeight
+        self.fileTop = 0           # index of the first visible file
+        self.fileSelected = None   # path of the selected file
+        self.filesVersion = None   # FileList.version on screen
+        self.filesDirty = True
+        self.filesPrinter = None
+
+        # Layer preview, the toolpath of the layer being printed above the graph
+        previewSize = self.graph_area_top - 20 - self.buttonsTop
+        self.preview_rect = pygame.Rect(self.leftPadding, self.buttonsTop, previewSize, previewSize)
+        self.previewSurface = None
+        self.previewShown = None   # (LayerIndex, layer) in previewSurface
+        self.previewDirty = True
+
+        # Webcam snapshots below the title, decoded to this size off the main loop
+        self.camera_rect = pygame.Rect(0, self.buttonsTop - 5, self.win_width, self.win_height - self.buttonsTop + 5)
+        self.cameraSurface = None
+        self.cameraShown = None   # Webcam.frameNumber in cameraSurface
+        self.cameraDirty = True
+
+        # Buttons drawn and touched on each screen
+        self.screens = { SCREEN_OVERVIEW: self.overviewScreen, SCREEN_DETAIL: self.detailScreen, SCREEN_FILES: self.filesScreen,
+                         SCREEN_PREVIEW: WidgetRegistry(), SCREEN_CAMERA: WidgetRegistry() }
+
+        # Damage tracking, only dirty rects are redrawn and sent to the display
+        self.dirtyRects = []
+        self.fullRedraw = True
+        self.graphDirty = True
+        self.labels = {}  # name -> (position, text, rect)
+        self.graph_rect = pygame.Rect(self.graph_area_left, self.graph_area_top, self.graph_area_width, self.graph_area_height)
+
+        # Pre-rendered static backgrounds per screen, built on first draw
+        self.backgrounds = {}  # (size, screen) -> surface
+
+        # Performance overlay, refreshed once a second while shown
+        self.overlay_rect = pygame.Rect(self.graph_area_left + 2, self.graph_area_top + 2, 150, 5 * 14 + 4)
+        self.overlay_time = 0.0
+        self.showOverlay = False
+        self._show_overlay(self.perfoverlay)
+
+        self._markStartup("widgets")
 
         # Init of class done
         print "OctoPiPanel initiated"
 
 
-    def _makeButton(self, x, y, title, color=(200, 200, 200)):
-        return pygbutton.PygButton((self.leftPadding + x * (self.buttonWidth + self.buttonSpace), self.buttonsTop + y * (self.buttonHeight + self.buttonVSpace), self.buttonWidth, self.buttonHeight), title, color) 
+    def _loadSettings(self):
+        # Read settings from OctoPiPanel.cfg settings file
+        cfg = loadSettings(self.settingsFilePath)
+
+        self.updatetime = cfg.getint('settings', 'updatetime')
+        self.backlightofftime = cfg.getint('settings', 'backlightofftime')
+        self.pollintervals = readPollIntervals(cfg, self.updatetime)
+
+        if cfg.has_option('settings', 'maxfps'):
+            self.maxfps = cfg.getint('settings', 'maxfps')
+        else:
+            self.maxfps = 20
+
+        if cfg.has_option('settings', 'push'):
+            self.usepush = cfg.getboolean('settings', 'push')
+        else:
+            self.usepush = False
+
+        if cfg.has_option('settings', 'historyfile'):
+            self.historyfile = cfg.get('settings', 'historyfile')
+        else:
+            self.historyfile = os.path.join(self.scriptDirectory, "temperature.history")
+
+        if cfg.has_option('settings', 'historyhours'):
+            self.historyhours = cfg.getint('settings', 'historyhours')
+        else:
+            self.historyhours = 12
+
+        if cfg.has_option('settings', 'filecache'):
+            self.filecache = cfg.get('settings', 'filecache')
+        else:
+            self.filecache = os.path.join(self.scriptDirectory, "files.cache")
+
+        # Layer indexes of G-code files, shared by all printers
+        if cfg.has_option('settings', 'previewcache'):
+            self.previewcache = cfg.get('settings', 'previewcache')
+        else:
+            self.previewcache = os.path.join(self.scriptDirectory, "previews")
+
+        self.printerSettings = readPrinters(cfg, self.historyfile, self.filecache)
+
+        # ms between webcam snapshots on the Camera screen
+        if cfg.has_option('settings', 'webcam_interval'):
+            self.webcaminterval = cfg.getint('settings', 'webcam_interval')
+        else:
+            self.webcaminterval = 1000
+
+        if cfg.has_option('settings', 'perfoverlay'):
+            self.perfoverlay = cfg.getboolean('settings', 'perfoverlay')
+        else:
+            self.perfoverlay = False
+
+        if cfg.has_option('settings', 'statsfile'):
+            self.statsfile = cfg.get('settings', 'statsfile')
+        else:
+            self.statsfile = None
+
+        if cfg.has_option('settings', 'statsinterval'):
+            self.statsinterval = cfg.getint('settings', 'statsinterval')
+        else:
+            self.statsinterval = 10
+
+        if cfg.has_option('settings', 'gpio_debounce'):
+            self.gpiodebounce = cfg.getint('settings', 'gpio_debounce')
+        else:
+            self.gpiodebounce = 50
+
+        if cfg.has_option('settings', 'gpio_longpress'):
+            self.gpiolongpress = cfg.getint('settings', 'gpio_longpress')
+        else:
+            self.gpiolongpress = 800
+
+        if cfg.has_option('settings', 'framebuffer'):
+            self.framebufferpath = cfg.get('settings', 'framebuffer')
+        else:
+            self.framebufferpath = None
+
+        if cfg.has_option('settings', 'framebuffer_depth'):
+            self.framebufferdepth = cfg.getint('settings', 'framebuffer_depth')
+        else:
+            self.framebufferdepth = None
+
+        if cfg.has_option('settings', 'window_width'):
+            self.win_width = cfg.getint('settings', 'window_width')
+        else:
+            self.win_width = 320
+
+        if cfg.has_option('settings', 'window_height'):
+            self.win_height = cfg.getint('settings', 'window_height')
+        else:
+            self.win_height = 240
+
+    def _openHistoryFile(self, printer, path):
+        try:
+            printer.historyFile = TempHistoryFile(path, self.historyhours * 3600 * 1000 / self.updatetime)
+        except (IOError, OSError) as e:
+            print "Temperature history of {0} not kept on disk: {1}".format(printer.name, e)
+            return
+
+        # Fill the graph with its time span, only that much is read before the first frame.
+        # Time the panel was off becomes gaps, so graphs keep their time scale and break their lines there
+        records = printer.historyFile.last(self.graph_area_width)
+        hotend, bed = withGaps(records, self.updatetime / 1000.0, time.time(), self.graph_area_width)
+        for sample in zip(hotend, bed):
+            printer.history.append(sample)
+
+    def _loadZoomHistory(self):
+        """Build the zoomed out graphs from everything recorded, once the first frame is up."""
+        start = time.time()
+        for printer in self.printers:
+            if printer.historyFile is None:
+                continue
+            records = printer.historyFile.last(len(printer.historyFile))
+            printer.zoom.load(withGaps(records, self.updatetime / 1000.0, start, printer.historyFile.capacity))
+        print "Zoom history loaded in {0:.0f}ms".format((time.time() - start) * 1000.0)
+
+    def _selectPrinter(self, printer):
+        """Show printer on the detail screen, buttons and graph act on it."""
+        self.printer = printer
+        self.api = printer.api
+        self.poller = printer.poller
+        self.commands = printer.commands
+        self.TempHistory = printer.history
+        self.TempZoom = printer.zoom
+
+        # Pick up its state on the next get_state, whatever its sequence
+        self.state_sequence = None
+
+    def _font(self, size):
+        """Bold Cyberbit in the given size. The font file is read from disk only once."""
+        font = self.fonts.get(size)
+        if font is None:
+            if self.fontData is None:
+                with open(os.path.join(self.scriptDirectory, "Cyberbit.ttf"), "rb") as fontFile:
+                    self.fontData = fontFile.read()
+            font = pygame.font.Font(StringIO(self.fontData), size)
+            font.set_bold(True)
+            self.fonts[size] = font
+        return font
+
+    def _markStartup(self, phase):
+        now = time.time()
+        self.timeline.append((phase, (now - self.timeline_mark) * 1000.0))
+        self.timeline_mark = now
+
+    def _logStartup(self):
+        total = (time.time() - _startTime) * 1000.0
+        print "Startup: {0} (first frame after {1:.0f}ms)".format(
+            ", ".join("{0} {1:.0f}ms".format(phase, ms) for phase, ms in self.timeline), total)
+
+    def _makeButton(self, x, y, title, color=(200, 200, 200), top=None, half=None):
+        """Button in column x, row y. top moves the rows, half 0 or 1 makes it the left or right half."""
+        if top is None:
+            top = self.buttonsTop
+        left = self.leftPadding + x * (self.buttonWidth + self.buttonSpace)
+        width = self.buttonWidth
+        if half is not None:
+            width = (self.buttonWidth - self.buttonVSpace) / 2
+            left += half * (self.buttonWidth - width)
+        return pygbutton.PygButton((left, top + y * (self.buttonHeight + self.buttonVSpace), width, self.buttonHeight), title, color)
 
 
     def Start(self):
@@ -164,34 +580,77 @@ class OctoPiPanel():
         print "OctoPiPanel started!"
         print "---"
         
-        """ game loop: input, move, render"""
+        # Get a first frame on screen before anything else
+        self.update()
+        self.draw()
+        self._markStartup("first frame")
+        self._logStartup()
+
+        # Before anything appends samples to the zoom pyramids
+        self._loadZoomHistory()
+
+        # Start polling every printer in the background
+        for printer in self.printers:
+            printer.start()
+
+        # Arm the backlight timeout
+        self._reset_backlight_timer()
+
+        # The graph gets one sample per updatetime, however often state arrives
+        pygame.time.set_timer(EVENT_SAMPLE, self.updatetime)
+
+        # Main loop statistics
+        self.clock = pygame.time.Clock()
+        self.idle_time = 0.0
+        self.active_time = 0.0
+        self.stats_time = time.time()
+        self.stats_cpu = sum(os.times()[:2])
+        self.perf_written = time.time()
+
+        """ game loop: sleep until something happens, then input, move, render"""
         while not self.done:
+            # Sleep until there is input, a new printer state or a timer
+            sleepStart = time.time()
+            events = [pygame.event.wait()]
+            wakeUp = time.time()
+            self.idle_time += wakeUp - sleepStart
+
             # Handle events
-            self.handle_events()
+            self.perf.measure("handle_events", self.handle_events, events + pygame.event.get())
 
-            # Update info from printer every other seconds
-            if pygame.time.get_ticks() - self.getstate_ticks > self.updatetime:
-                self.get_state()
-                self.getstate_ticks = pygame.time.get_ticks()
+            # Pick up the latest info from the printer
+            self.perf.measure("get_state", self.get_state)
 
-            # Is it time to turn of the backlight?
-            if self.backlightofftime > 0 and platform.system() == 'Linux':
-                if pygame.time.get_ticks() - self.bglight_ticks > self.backlightofftime:
-                    # disable the backlight
-                    os.system("echo '0' > /sys/class/backlight/soc\:backlight/brightness")
-                    self.bglight_ticks = pygame.time.get_ticks()
-                    self.bglight_on = False
-            
-            # Update buttons visibility, text, graphs etc
-            self.update()
+            # Nobody can see the display, don't render anything
+            if self.backlight.on:
+                # Update buttons visibility, text, graphs etc
+                self.perf.measure("update", self.update)
+
+                # Draw everything
+                self.perf.measure("draw", self.draw)
+
+            self.active_time += time.time() - wakeUp
+            self.perf.record("frame", (time.time() - wakeUp) * 1000.0)
+
+            # Never draw faster than maxfps
+            sleepStart = time.time()
+            self.clock.tick(self.maxfps)
+            self.idle_time += time.time() - sleepStart
+
+            self._report_loop_stats()
+            self._write_perf_stats()
 
-            # Draw everything
-            self.draw()
-            
         """ Clean up """
+        # stop polling the printers
+        for printer in self.printers:
+            printer.stop()
+        self.pool.close()
+
+        if self.framebuffer is not None:
+            self.framebuffer.close()
+
         # enable the backlight before quiting
-        if platform.system() == 'Linux':
-            os.system("echo '1' > /sys/class/backlight/soc\:backlight/brightness")
+        self.backlight.close()
         
         # clean up GPIO
         GPIO.cleanup()
@@ -202,9 +661,9 @@ class OctoPiPanel():
         """ Quit """
         pygame.quit()
        
-    def handle_events(self):
+    def handle_events(self, events):
         """handle all events."""
-        for event in pygame.event.get():
+        for event in events:
             if event.type == pygame.QUIT:
                 print "quit"
                 self.done = True
@@ -219,119 +678,205 @@ class OctoPiPanel():
                 if event.key == pygame.K_a:
                     print "Got A key"
 
-            # It should only be possible to click a button if you can see it
-            #  e.g. the backlight is on
-            if self.bglight_on:
-                if 'click' in self.btnHomeXY.handleEvent(event):
-                    self._home_xy()
-
-                if 'click' in self.btnHomeZ.handleEvent(event):
-                    self._home_z()
-
-                if 'click' in self.btnZUp.handleEvent(event):
-                    self._z_up()
-
-                if 'click' in self.btnGetReady.handleEvent(event):
-                    self._get_ready()
-
-                if 'click' in self.btnHeatHotEnd.handleEvent(event):
-                    self._heat_hotend()
+                # Toggle the performance overlay
+                if event.key == pygame.K_p:
+                    self._show_overlay(not self.showOverlay)
 
-                if 'click' in self.btnStartPrint.handleEvent(event):
-                    self._start_print()
-
-                if 'click' in self.btnAbortPrint.handleEvent(event):
-                    self._abort_print()
-
-                if 'click' in self.btnPausePrint.handleEvent(event):
-                    self._pause_print()
+            # A queued command finished, make its effect show up quickly
+            if event.type == EVENT_COMMAND:
+                if event.result.success:
+                    event.printer.poller.refresh()
+                else:
+                    print "Command {0} to {1} failed after {2} attempt(s): {3}".format(event.result.data.get('command'), event.printer.name, event.result.attempts, event.result.error)
+
+            # Save temperatures of every printer to its history
+            if event.type == EVENT_SAMPLE:
+                for printer in self.printers:
+                    state = printer.sample()
+                    if printer is self.printer:
+                        temps = [state.HotEndTemp, state.BedTemp]
+                if self.backlight.on and self.screenName in GRAPH_SCREENS:
+                    if self.zoom == 0:
+                        self.graph.push(temps)
+                        self.graphDirty = True
+                    else:
+                        self._rebuildGraph()
+
+            # Run the actions of GPIO buttons
+            if event.type == EVENT_GPIO:
+                self.gpio.process()
+
+                # Keep waking up while a held button may become a long press
+                pygame.time.set_timer(EVENT_GPIO, 50 if self.gpio.holding() else 0)
 
-                if 'click' in self.btnExtrude.handleEvent(event):
-                    self._extrude()
+            # Is it time to turn of the backlight?
+            if event.type == EVENT_BACKLIGHT:
+                self._power_down()
 
-                if 'click' in self.btnShutdown.handleEvent(event):
-                    self._shutdown()
+            # It should only be possible to click a button if you can see it
+            #  e.g. the backlight is on
+            if self.backlight.on and self.screenName == SCREEN_OVERVIEW:
+                # Tapping a printer opens its detail screen
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    row = (event.pos[1] - self.buttonsTop) // self.overview_rowHeight
+                    index = self.overviewTop + row
+                    if event.pos[1] >= self.buttonsTop and row < self.overview_rows and index < len(self.printers):
+                        self._selectPrinter(self.printers[index])
+                        self._show_screen(SCREEN_DETAIL)
+
+                self.overviewScreen.dispatch(event)
+
+            elif self.backlight.on and self.screenName == SCREEN_FILES:
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    if event.pos[1] < self.buttonsTop:
+                        # Tapping the title goes back
+                        self._show_screen(SCREEN_DETAIL)
+                    elif self.file_rect.collidepoint(event.pos):
+                        # Tapping a file selects it
+                        index = self.fileTop + (event.pos[1] - self.file_rect.top) // self.file_rowHeight
+                        entries = self.printer.files.entries
+                        if index < len(entries):
+                            self.fileSelected = entries[index].path
+                            self.filesDirty = True
+
+                self.filesScreen.dispatch(event)
+
+            elif self.backlight.on and self.screenName == SCREEN_PREVIEW:
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    if event.pos[1] < self.buttonsTop:
+                        # Tapping the title goes back
+                        self._show_screen(SCREEN_DETAIL)
+                    elif self.graph_rect.collidepoint(event.pos):
+                        self.zoom = (self.zoom + 1) % len(GRAPH_ZOOMS)
+                        self._rebuildGraph()
+
+            elif self.backlight.on and self.screenName == SCREEN_CAMERA:
+                # Tapping the title goes back
+                if event.type == pygame.MOUSEBUTTONDOWN and event.pos[1] < self.camera_rect.top:
+                    self._show_screen(SCREEN_DETAIL)
+
+            elif self.backlight.on:
+                # Tapping the title goes back to the overview
+                if event.type == pygame.MOUSEBUTTONDOWN and event.pos[1] < self.buttonsTop and len(self.printers) > 1:
+                    self._show_screen(SCREEN_OVERVIEW)
+
+                self.detailScreen.dispatch(event)
+
+                # Tapping the graph switches its time span
+                if event.type == pygame.MOUSEBUTTONDOWN and self.graph_rect.collidepoint(event.pos):
+                    self.zoom = (self.zoom + 1) % len(GRAPH_ZOOMS)
+                    self._rebuildGraph()
             
             # Did the user click on the screen?
             if event.type == pygame.MOUSEBUTTONDOWN:
                 # Reset backlight counter
-                self.bglight_ticks = pygame.time.get_ticks()
+                self._reset_backlight_timer()
+
+                if not self.backlight.on:
+                    self._power_up()
+
+    def _power_down(self):
+        """Turn the backlight off, stop rendering and poll less often."""
+        pygame.time.set_timer(EVENT_BACKLIGHT, 0)
+        self.backlight.set(False)
+        for printer in self.printers:
+            printer.poller.powersave = True
+            printer.webcam.hide()
+        print "Background light off."
+
+    def _power_up(self):
+        """Turn the backlight on and repaint everything with fresh data."""
+        self.backlight.set(True)
+        for printer in self.printers:
+            printer.poller.powersave = False
+            printer.poller.refresh()
+
+        if self.screenName == SCREEN_CAMERA:
+            self._watchWebcam()
+
+        # The graph wasn't scrolled while the display was off
+        self._rebuildGraph()
+        self.fullRedraw = True
+        print "Background light on."
+
+    def _reset_backlight_timer(self):
+        if self.backlightofftime > 0 and platform.system() == 'Linux':
+            pygame.time.set_timer(EVENT_BACKLIGHT, self.backlightofftime)
+
+    def _state_published(self):
+        # Called on the poller's thread, wake up the main loop
+        try:
+            pygame.event.post(pygame.event.Event(EVENT_STATE))
+        except pygame.error:
+            # Queue is full, the main loop is awake anyway
+            pass
+
+    def _gpio_edge(self):
+        # Called on RPi.GPIO's thread, wake up the main loop
+        try:
+            pygame.event.post(pygame.event.Event(EVENT_GPIO))
+        except pygame.error:
+            # Queue is full or the display isn't up yet, the edge stays queued
+            pass
 
-                if not self.bglight_on and platform.system() == 'Linux':
-                    # enable the backlight
-                    os.system("echo '1' > /sys/class/backlight/soc\:backlight/brightness")
-                    self.bglight_on = True
-                    print "Background light on."
+    def _command_done(self, printer, result):
+        # Called on the command queue's thread, hand the result to the main loop
+        try:
+            pygame.event.post(pygame.event.Event(EVENT_COMMAND, printer=printer, result=result))
+        except pygame.error:
+            pass
+
+    def _report_loop_stats(self):
+        """Print how much of the time the main loop was busy, once a minute."""
+        now = time.time()
+        if now - self.stats_time < 60:
+            return
+
+        cpu = sum(os.times()[:2])
+        total = self.idle_time + self.active_time
+        if total > 0:
+            print "Main loop: {0:.1f}% active, {1:.1f}% idle, {2:.1f}s CPU in {3:.0f}s".format(
+                100.0 * self.active_time / total, 100.0 * self.idle_time / total, cpu - self.stats_cpu, now - self.stats_time)
+        print "Text cache: {0} hits, {1} misses".format(self.textCache.hits, self.textCache.misses)
+        if self.gpio.actionCount:
+            print "GPIO: {0} actions, {1:.1f}ms average edge to action, {2} bounces ignored".format(
+                self.gpio.actionCount, self.gpio.averageLatency(), self.gpio.bounced)
+
+        self.idle_time = 0.0
+        self.active_time = 0.0
+        self.stats_time = now
+        self.stats_cpu = cpu
 
     """
-    Get status update from API, regarding temp etc.
+    Pick up the latest status snapshot published by the state poller.
+    Never blocks on the network.
     """
     def get_state(self):
-        try:
-            req = requests.get(self.apiurl_status)
-
-            if req.status_code == 200:
-                state = json.loads(req.text)
-                # print json.dumps(state, indent=2)
-        
-                # Set status flags
-                tempKey = 'temps' if 'temps' in state else 'temperature'
-                self.HotEndTemp = state[tempKey]['tool0']['actual']
-                self.HotEndTempTarget = state[tempKey]['tool0']['target']
-                if 'bed' in state[tempKey]:
-                    self.BedTemp = state[tempKey]['bed']['actual']
-                    self.BedTempTarget = state[tempKey]['bed']['target']
-
-                if self.HotEndTempTarget is None:
-                    self.HotEndTempTarget = 0.0
-
-                if self.BedTempTarget is None:
-                    self.BedTempTarget = 0.0
-        
-                if self.BedTemp is None:
-                    self.BedTemp = 0.0
-        
-                if self.HotEndTempTarget > 0.0:
-                    self.HotHotEnd = True
-                else:
-                    self.HotHotEnd = False
-
-                #print self.apiurl_status
-            elif req.status_code == 401:
-                print "Error: {0}".format(req.text)
-                
-            # Get info about current job
-            req = requests.get(self.apiurl_job + self.addkey)
-            if req.status_code == 200:
-                jobState = json.loads(req.text)
-
-            req = requests.get(self.apiurl_connection + self.addkey)
-            if req.status_code == 200:
-                connState = json.loads(req.text)
-
-                #print self.apiurl_job + self.addkey
-            
-                self.Completion = jobState['progress']['completion'] # In procent
-                self.PrintTimeLeft = jobState['progress']['printTimeLeft']
-                #self.Height = state['currentZ']
-                self.FileName = jobState['job']['file']['name']
-                self.JobLoaded = connState['current']['state'] == "Operational" and (jobState['job']['file']['name'] != "") or (jobState['job']['file']['name'] != None)
-
-                # Save temperatures to lists
-                self.HotEndTempList.popleft()
-                self.HotEndTempList.append(self.HotEndTemp)
-                self.BedTempList.popleft()
-                self.BedTempList.append(self.BedTemp)
-
-                #print self.HotEndTempList
-                #print self.BedTempList
-
-                self.Paused = connState['current']['state'] == "Paused"
-                self.Printing = connState['current']['state'] == "Printing"
-
-                
-        except requests.exceptions.ConnectionError as e:
-            print "Connection Error ({0}): {1}".format(e.errno, e.strerror)
+        state = self.poller.latest()
+        if state.sequence == self.state_sequence:
+            return
+
+        self.state_sequence = state.sequence
+
+        # Set status flags
+        self.HotEndTemp = state.HotEndTemp
+        self.HotEndTempTarget = state.HotEndTempTarget
+        self.BedTemp = state.BedTemp
+        self.BedTempTarget = state.BedTempTarget
+        self.HotHotEnd = state.HotHotEnd
+        self.Completion = state.Completion # In procent
+        self.PrintTimeLeft = state.PrintTimeLeft
+        self.FileName = state.FileName
+        self.FileOrigin = state.FileOrigin
+        self.FilePath = state.FilePath
+        self.FilePos = state.FilePos
+        self.JobLoaded = state.JobLoaded
+        self.Paused = state.Paused
+        self.Printing = state.Printing
+
+        # Target lines move with the targets
+        if self.graph.setTargets([self.HotEndTempTarget, self.BedTempTarget]):
+            self.graphDirty = True
 
         return
 
@@ -339,6 +884,22 @@ class OctoPiPanel():
     Update buttons, text, graphs etc.
     """
     def update(self):
+        if self.screenName == SCREEN_OVERVIEW:
+            self._updateOverview()
+            return
+
+        if self.screenName == SCREEN_FILES:
+            self._updateFiles()
+            return
+
+        if self.screenName == SCREEN_PREVIEW:
+            self._updatePreview()
+            return
+
+        if self.screenName == SCREEN_CAMERA:
+            self._updateCamera()
+            return
+
         # Set home buttons visibility
         self.btnHomeXY.visible = not (self.Printing or self.Paused)
         self.btnHomeZ.visible = not (self.Printing or self.Paused)
@@ -346,6 +907,9 @@ class OctoPiPanel():
 
         # Set abort and pause buttons visibility
         self.btnStartPrint.visible = not (self.Printing or self.Paused) and self.JobLoaded
+        self.btnFiles.visible = not (self.Printing or self.Paused)
+        self.btnPreview.visible = self.Printing or self.Paused
+        self.btnCamera.visible = self.Printing or self.Paused
         self.btnAbortPrint.visible = self.Printing or self.Paused
         self.btnPausePrint.visible = self.Printing or self.Paused
 
@@ -366,46 +930,30 @@ class OctoPiPanel():
             self.btnHeatHotEnd.caption = "Cool hot end"
         else:
             self.btnHeatHotEnd.caption = "Heat hot end"
-        
-        return
-
-    def _drawText(self, x, y, title):
-        button = self.fntText.render(title, 1, (200, 200, 200))
-        self.screen.blit(button, (x, y))
-
-
-    def draw(self):
-        #clear whole screen
-        self.screen.fill( self.color_bg )
-
-        # Draw buttons
-        self.btnHomeXY.draw(self.screen)
-        self.btnHomeZ.draw(self.screen)
-        self.btnZUp.draw(self.screen)
-        self.btnGetReady.draw(self.screen)
-        self.btnHeatHotEnd.draw(self.screen)
-        self.btnStartPrint.draw(self.screen)
-        self.btnAbortPrint.draw(self.screen)
-        self.btnPausePrint.draw(self.screen)
-        self.btnExtrude.draw(self.screen)
-        self.btnShutdown.draw(self.screen)
 
+        # GPIO button hints
         yPosition = 1
-        if not (self.Printing or self.Paused):
-            self._drawText(150, yPosition, "be rdy")
-            self._drawText(205, yPosition, "z up")
-            self._drawText(295, yPosition, "extr")
+        idle = not (self.Printing or self.Paused)
+        self._setLabel("ready", (150, yPosition), "be rdy" if idle else "")
+        self._setLabel("zup", (205, yPosition), "z up" if idle else "")
+        self._setLabel("extrude", (295, yPosition), "extr" if idle else "")
 
         if self.Printing or self.Paused:
-            self._drawText(255, yPosition, "abort")
+            self._setLabel("startabort", (255, yPosition), "abort")
         elif not (self.Printing or self.Paused) and self.JobLoaded:
-            self._drawText(255, yPosition, "start")
+            self._setLabel("startabort", (255, yPosition), "start")
+        else:
+            self._setLabel("startabort", (255, yPosition), "")
+
+        # Which printer this is, tap it to go back to the overview
+        if len(self.printers) > 1:
+            self._setLabel("printer", (self.leftPadding, yPosition), u"< {0}".format(self.printer.name[:16]))
 
+        xPosition = self.leftPadding + self.buttonWidth + self.buttonSpace
         yPosition = self.buttonsTop + 2 * (self.buttonHeight + self.buttonVSpace)
 
         # Place temperatures texts
-        lblHotEndTemp = self.fntText.render(u'Hot end: {0}\N{DEGREE SIGN}C ({1}\N{DEGREE SIGN}C)'.format(self.HotEndTemp, self.HotEndTempTarget), 1, (200, 200, 200))
-        self.screen.blit(lblHotEndTemp, (self.leftPadding + self.buttonWidth + self.buttonSpace, yPosition))
+        self._setLabel("hotend", (xPosition, yPosition), u'Hot end: {0}\N{DEGREE SIGN}C ({1}\N{DEGREE SIGN}C)'.format(self.HotEndTemp, self.HotEndTempTarget))
 
         # Place time left and compeltetion texts
         if not self.JobLoaded or self.PrintTimeLeft is None or self.Completion is None:
@@ -413,68 +961,393 @@ class OctoPiPanel():
             self.PrintTimeLeft = 0
 
         yPosition += 15
-        lblPrintTimeLeft = self.fntText.render("Time left: {0}".format(datetime.timedelta(seconds = self.PrintTimeLeft)), 1, (200, 200, 200))
-        self.screen.blit(lblPrintTimeLeft, (self.leftPadding + self.buttonWidth + self.buttonSpace, yPosition))
+        self._setLabel("timeleft", (xPosition, yPosition), "Time left: {0}".format(datetime.timedelta(seconds = self.PrintTimeLeft)))
 
         yPosition += 15
-        lblCompletion = self.fntText.render("Completion: {0:.1f}%".format(self.Completion), 1, (200, 200, 200))
-        self.screen.blit(lblCompletion, (self.leftPadding + self.buttonWidth + self.buttonSpace, yPosition))
+        self._setLabel("completion", (xPosition, yPosition), "Completion: {0:.1f}%".format(self.Completion))
+
+        # Time span of the graph
+        self._setLabel("zoom", (self.graph_area_left + self.graph_area_width - 40, self.graph_area_top - 15), GRAPH_ZOOMS[self.zoom][0])
+
+        return
+
+    def _updateOverview(self):
+        """Name and a status line for every printer on the current page, one row each."""
+        count = len(self.printers)
+        if count > self.overview_rows:
+            last = min(count, self.overviewTop + self.overview_rows)
+            self._setLabel("title", (self.leftPadding, 1), "Printers {0}-{1} of {2}".format(self.overviewTop + 1, last, count))
+        else:
+            self._setLabel("title", (self.leftPadding, 1), "Printers")
+
+        self.btnOverviewUp.visible = self.overviewTop > 0
+        self.btnOverviewDown.visible = self.overviewTop + self.overview_rows < count
+
+        for row in range(self.overview_rows):
+            yPosition = self.buttonsTop + row * self.overview_rowHeight
+            index = self.overviewTop + row
+            if index < count:
+                printer = self.printers[index]
+                self._setLabel("name{0}".format(row), (self.leftPadding, yPosition), printer.name)
+                self._setLabel("status{0}".format(row), (self.leftPadding + 10, yPosition + 15), printer.status())
+            else:
+                self._setLabel("name{0}".format(row), (self.leftPadding, yPosition), "")
+                self._setLabel("status{0}".format(row), (self.leftPadding + 10, yPosition + 15), "")
+
+    def _updateFiles(self):
+        """The file list is redrawn when the listing, scroll position or selection changed."""
+        files = self.printer.files
+        entries = files.entries
+        if files.version != self.filesVersion:
+            self.filesVersion = files.version
+            self.fileTop = max(0, min(self.fileTop, len(entries) - self.file_rows))
+            self.filesDirty = True
+
+        self.btnFilesUp.visible = self.fileTop > 0
+        self.btnFilesDown.visible = self.fileTop + self.file_rows < len(entries)
+        self.btnFilesLoad.visible = self.fileSelected is not None and not (self.Printing or self.Paused)
+
+        if files.loading:
+            status = "Loading..."
+        elif files.error is not None:
+            status = "Offline"
+        else:
+            status = "{0} files".format(len(entries))
+        self._setLabel("title", (self.leftPadding, 1), "< Files")
+        self._setLabel("status", (self.win_width - 100, 1), status)
+
+    def _updatePreview(self):
+        """Follow the job's file position, the preview is redrawn when the layer changes."""
+        preview = self.printer.preview
+        if self.FilePath:
+            preview.show(self.FileOrigin, self.FilePath)
+
+        index = preview.index
+        layer = None
+        if index is not None and len(index):
+            layer = index.layerAt(self.FilePos)
+
+        if (index, layer) != self.previewShown:
+            self.previewShown = (index, layer)
+            self._renderPreview(index, layer)
+
+        if not self.FilePath:
+            status = "No job"
+        elif index is not None:
+            status = ""
+        elif preview.error is not None:
+            status = "No preview"
+        else:
+            status = "Indexing {0:.0f}%".format(100.0 * preview.progress)
+
+        xPosition = self.preview_rect.right + 10
+        yPosition = self.buttonsTop
+        self._setLabel("title", (self.leftPadding, 1), "< Preview")
+        self._setLabel("previewfile", (xPosition, yPosition), (self.FileName or "")[:24])
+        if layer is not None:
+            self._setLabel("layer", (xPosition, yPosition + 15), "Layer {0} / {1}".format(layer + 1, len(index)))
+            self._setLabel("layerz", (xPosition, yPosition + 30), "Z {0:.2f} mm".format(index.layers[layer][0]))
+        else:
+            self._setLabel("layer", (xPosition, yPosition + 15), "")
+            self._setLabel("layerz", (xPosition, yPosition + 30), "")
+        self._setLabel("previewstatus", (xPosition, yPosition + 45), status)
+        self._setLabel("completion", (xPosition, yPosition + 60), "Completion: {0:.1f}%".format(self.Completion or 0))
+        self._setLabel("zoom", (self.graph_area_left + self.graph_area_width - 40, self.graph_area_top - 15), GRAPH_ZOOMS[self.zoom][0])
+
+    def _updateCamera(self):
+        """Pick up the newest decoded snapshot, it only needs to be blitted."""
+        webcam = self.printer.webcam
+        if webcam.frameNumber != self.cameraShown:
+            self.cameraShown = webcam.frameNumber
+            self.cameraSurface = webcam.frame
+            self.cameraDirty = True
+
+        if webcam.error is not None:
+            status = "No camera"
+        elif webcam.frame is None:
+            status = "Connecting..."
+        else:
+            status = time.strftime("%H:%M:%S", time.localtime(webcam.frameTime))
+        self._setLabel("title", (self.leftPadding, 1), "< Camera")
+        self._setLabel("status", (self.win_width - 100, 1), status)
+
+    def _watchWebcam(self):
+        # Snapshots are decoded straight to the size and pixel format they're shown in
+        self.printer.webcam.show(self.camera_rect.size, self.screen)
+        self.cameraShown = None
+
+    def _renderPreview(self, index, layer):
+        """Draw the segments of one layer, scaled to fit, into the preview surface."""
+        width, height = self.preview_rect.size
+        surface = pygame.Surface((width, height))
+        surface.fill((255, 255, 255))
+
+        if layer is not None:
+            minX, minY, maxX, maxY = index.bounds
+            scale = min((width - 4) / max(maxX - minX, 1.0), (height - 4) / max(maxY - minY, 1.0))
+            left = (width - (maxX - minX) * scale) / 2.0
+            bottom = height - (height - (maxY - minY) * scale) / 2.0
+
+            # Segments are in tenths of a millimeter, Y grows upwards on the bed
+            scale /= 10.0
+            left -= minX * 10 * scale
+            bottom += minY * 10 * scale
+            segments = index.segments(layer)
+            for i in range(0, len(segments), 4):
+                pygame.draw.line(surface, (220, 0, 0),
+                                 (left + segments[i] * scale, bottom - segments[i + 1] * scale),
+                                 (left + segments[i + 2] * scale, bottom - segments[i + 3] * scale))
+
+        self.previewSurface = surface.convert(self.screen)
+        self.previewDirty = True
+
+    def _show_screen(self, name):
+        """Switch to the overview of all printers, the detail screen, the file list, the layer preview or the webcam."""
+        self.screenName = name
+        self.labels = {}
+        self.fullRedraw = True
+        if name in GRAPH_SCREENS:
+            self._rebuildGraph()
+
+        # Only fetch snapshots while they're shown
+        if name == SCREEN_CAMERA:
+            self._watchWebcam()
+        else:
+            self.printer.webcam.hide()
+
+    def _setLabel(self, name, position, text):
+        """Set the text of a label, marking it dirty if it changed. Empty text hides it."""
+        label = self.labels.get(name)
+        if label is not None:
+            if label[0] == position and label[1] == text:
+                return
+            self.dirtyRects.append(label[2])
+
+        rect = pygame.Rect(position, self.fntText.size(text))
+        self.labels[name] = (position, text, rect)
+        self.dirtyRects.append(rect)
+
+    def _drawText(self, x, y, title):
+        button = self.textCache.render(self.fntText, title, (200, 200, 200))
+        self.screen.blit(button, (x, y))
+
+
+    def draw(self):
+        # Static background of the current screen, rebuilt if the window size changed
+        key = (self.screen.get_size(), self.screenName)
+        if key not in self.backgrounds:
+            self.backgrounds = dict((k, v) for k, v in self.backgrounds.items() if k[0] == key[0])
+            self.backgrounds[key] = self._buildBackground(self.screenName)
+            self.fullRedraw = True
+        background = self.backgrounds[key]
+
+        # Collect damage from all widgets
+        if self.fullRedraw:
+            self.fullRedraw = False
+            self.dirtyRects = [self.screen.get_rect()]
+
+        buttons = self.screens[self.screenName].widgets
+        for button in buttons:
+            if button.dirty:
+                button.dirty = False
+                self.dirtyRects.append(button.rect)
+
+        if self.graphDirty:
+            self.graphDirty = False
+            if self.screenName in GRAPH_SCREENS:
+                self.dirtyRects.append(self.graph_rect)
+
+        if self.previewDirty:
+            self.previewDirty = False
+            if self.screenName == SCREEN_PREVIEW:
+                self.dirtyRects.append(self.preview_rect)
+
+        if self.cameraDirty:
+            self.cameraDirty = False
+            if self.screenName == SCREEN_CAMERA:
+                self.dirtyRects.append(self.camera_rect)
+
+        if self.filesDirty:
+            self.filesDirty = False
+            if self.screenName == SCREEN_FILES:
+                self.dirtyRects.append(self.file_rect)
+
+        if self.showOverlay and time.time() - self.overlay_time >= 1.0:
+            self.dirtyRects.append(self.overlay_rect)
+
+        # Nothing changed, nothing to draw
+        if not self.dirtyRects:
+            return
+
+        rects = self.dirtyRects
+        self.dirtyRects = []
+
+        # Redraw only what lies inside each dirty rect
+        for rect in rects:
+            self.screen.set_clip(rect)
+            self.screen.blit(background, rect, rect)
+
+            # Draw buttons
+            for button in buttons:
+                if button.rect.colliderect(rect):
+                    button.draw(self.screen)
+
+            # Draw labels
+            for position, text, lblRect in self.labels.values():
+                if text and lblRect.colliderect(rect):
+                    self._drawText(position[0], position[1], text)
+
+            # Draw graph, never outside its own area
+            if self.screenName in GRAPH_SCREENS and self.graph_rect.colliderect(rect):
+                self.screen.set_clip(rect.clip(self.graph_rect))
+                self._drawGraph()
+
+            # Draw the layer preview
+            if self.screenName == SCREEN_PREVIEW and self.previewSurface is not None and self.preview_rect.colliderect(rect):
+                self.screen.set_clip(rect.clip(self.preview_rect))
+                self.screen.blit(self.previewSurface, self.preview_rect)
+
+            # Draw the latest webcam snapshot, already at display size
+            if self.screenName == SCREEN_CAMERA and self.cameraSurface is not None and self.camera_rect.colliderect(rect):
+                self.screen.set_clip(rect.clip(self.camera_rect))
+                self.screen.blit(self.cameraSurface, self.camera_rect)
+
+            # Draw the visible part of the file list
+            if self.screenName == SCREEN_FILES and self.file_rect.colliderect(rect):
+                self.screen.set_clip(rect.clip(self.file_rect))
+                self._drawFiles()
+
+        self.screen.set_clip(None)
+
+        # Performance overlay goes on top of everything
+        if self.showOverlay and self.overlay_rect.collidelist(rects) != -1:
+            self._drawOverlay()
+            rects.append(self.overlay_rect)
+
+        # update screen
+        if self.framebuffer is not None:
+            self.framebuffer.update(rects)
+        else:
+            pygame.display.update(rects)
+        self.perf.frame()
+
+    def _rebuildGraph(self):
+        """Redraw the whole graph surface for the current time span."""
+        name, seconds = GRAPH_ZOOMS[self.zoom]
+        if self.zoom == 0:
+            # One sample per pixel, scrolled as samples arrive
+            self.graph.rebuild(self.TempHistory)
+        else:
+            if seconds is not None:
+                samples = seconds * 1000 / self.updatetime
+            elif self.printer.printStartSample is not None:
+                samples = self.TempZoom.total - self.printer.printStartSample
+            else:
+                samples = self.TempZoom.total
+            self.graph.drawEnvelope([self.TempZoom.columns(series, samples, self.graph_area_width) for series in range(2)])
+        self.graphDirty = True
+
+    def _drawGraph(self):
+        # Temperatures and target temperatures, scrolled and drawn as samples arrive
+        self.graph.draw(self.screen, (self.graph_area_left, self.graph_area_top))
+
+    def _drawFiles(self):
+        # Only the rows on screen are rendered, however many files there are
+        entries = self.printer.files.entries
+        yPosition = self.file_rect.top
+        for entry in entries[self.fileTop:self.fileTop + self.file_rows]:
+            if entry.path == self.fileSelected:
+                self.screen.fill((70, 100, 115), (self.file_rect.left, yPosition, self.file_rect.width, self.file_rowHeight))
+            self._drawText(self.file_rect.left + 2, yPosition + 2, entry.display)
+            yPosition += self.file_rowHeight
+
+    def _drawOverlay(self):
+        self.overlay_time = time.time()
+        lines = [
+            "FPS: {0:.1f}".format(self.perf.fps()),
+            "Frame: {0:.1f} / {1:.1f} ms".format(self.perf.percentile("frame", 0.50), self.perf.percentile("frame", 0.95)),
+            "Last poll: {0:.0f} ms".format(self.api.lastLatency),
+            "Queue: {0}".format(self.commands.depth()),
+            "GPIO: {0:.1f} ms".format(self.gpio.lastLatency),
+        ]
+
+        self.screen.fill((0, 0, 0), self.overlay_rect)
+        y = self.overlay_rect.top + 2
+        for line in lines:
+            self.screen.blit(self.fntText.render(line, 1, (0, 255, 0)), (self.overlay_rect.left + 2, y))
+            y += 14
+
+    def _show_overlay(self, show):
+        self.showOverlay = show
+        self.perf.enabled = show or self.statsfile is not None
+        self.dirtyRects.append(self.overlay_rect)
+
+    def _write_perf_stats(self):
+        """Write rolling timings to the stats file every statsinterval seconds."""
+        if self.statsfile is None or time.time() - self.perf_written < self.statsinterval:
+            return
+
+        self.perf_written = time.time()
+        try:
+            self.perf.write(self.statsfile, { "queue_depth": self.commands.depth(), "last_poll_ms": self.api.lastLatency, "last_gpio_ms": self.gpio.lastLatency })
+        except (IOError, OSError) as e:
+            print "Could not write stats file: {0}".format(e)
+
+    def _buildBackground(self, screenName):
+        """Pre-render everything that never changes at runtime into one surface."""
+        size = self.screen.get_size()
+        background = pygame.Surface(size)
+        background.fill(self.color_bg)
+
+        # File list, a frame around it
+        if screenName == SCREEN_FILES:
+            pygame.draw.rect(background, (90, 110, 120), self.file_rect.inflate(2, 2), 1)
+            return background.convert(self.screen)
+
+        # Webcam, the snapshot covers everything below the title
+        if screenName == SCREEN_CAMERA:
+            return background.convert(self.screen)
+
+        # Overview, a line between printers
+        if screenName == SCREEN_OVERVIEW:
+            for row in range(1, min(len(self.printers), self.overview_rows)):
+                yPosition = self.buttonsTop + row * self.overview_rowHeight - 2
+                pygame.draw.line(background, (90, 110, 120), [self.leftPadding, yPosition], [size[0] - self.leftPadding, yPosition], 1)
+            return background.convert(self.screen)
+
+        # Layer preview, a frame around it
+        if screenName == SCREEN_PREVIEW:
+            pygame.draw.rect(background, (90, 110, 120), self.preview_rect.inflate(2, 2), 1)
 
         # Temperature Graphing
         # Graph area
-        pygame.draw.rect(self.screen, (255, 255, 255), (self.graph_area_left, self.graph_area_top, self.graph_area_width, self.graph_area_height))
+        pygame.draw.rect(background, (255, 255, 255), (self.graph_area_left, self.graph_area_top, self.graph_area_width, self.graph_area_height))
 
         # Graph axes
         # X, temp
-        pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left, self.graph_area_top], [self.graph_area_left, self.graph_area_top + self.graph_area_height], 2)
+        pygame.draw.line(background, (0, 0, 0), [self.graph_area_left, self.graph_area_top], [self.graph_area_left, self.graph_area_top + self.graph_area_height], 2)
 
         # X-axis divisions and scale
         for i in range(6):
-            pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left - 3, self.graph_area_top + (self.graph_area_height / 5) * (5-i)], [self.graph_area_left, self.graph_area_top + (self.graph_area_height / 5) * (5-i)], 2)
-            lbl0 = self.fntTextSmall.render(str(i*50), 1, (200, 200, 200))
-            self.screen.blit(lbl0, (self.graph_area_left - 26, self.graph_area_top - 6 + (self.graph_area_height / 5) * (5-i)))
+            pygame.draw.line(background, (0, 0, 0), [self.graph_area_left - 3, self.graph_area_top + (self.graph_area_height / 5) * (5-i)], [self.graph_area_left, self.graph_area_top + (self.graph_area_height / 5) * (5-i)], 2)
+            lbl0 = self._font(10).render(str(i*50), 1, (200, 200, 200))
+            background.blit(lbl0, (self.graph_area_left - 26, self.graph_area_top - 6 + (self.graph_area_height / 5) * (5-i)))
  
         # X-axis divisions, grey lines
         for i in range(4):
-            pygame.draw.line(self.screen, (200, 200, 200), [self.graph_area_left + 2, self.graph_area_top + (self.graph_area_height / 5) * (4-i)], [self.graph_area_left + self.graph_area_width - 2, self.graph_area_top + (self.graph_area_height / 5) * (4-i)], 1)
-        
+            pygame.draw.line(background, (200, 200, 200), [self.graph_area_left + 2, self.graph_area_top + (self.graph_area_height / 5) * (4-i)], [self.graph_area_left + self.graph_area_width - 2, self.graph_area_top + (self.graph_area_height / 5) * (4-i)], 1)
+
         # Y, time, 2 seconds per pixel
-        pygame.draw.line(self.screen, (0, 0, 0), [self.graph_area_left, self.graph_area_top + self.graph_area_height], [self.graph_area_left + self.graph_area_width, self.graph_area_top + self.graph_area_height], 2)
-        
-        # Scaling factor
-        g_scale = self.graph_area_height / 250.0
-
-        # Print temperatures for hot end
-        i = 0
-        for t in self.HotEndTempList:
-            x = self.graph_area_left + i
-            y = self.graph_area_top + self.graph_area_height - int(t * g_scale)
-            pygame.draw.line(self.screen, (220, 0, 0), [x, y], [x + 1, y], 2)
-            i += 1
-
-        # Print temperatures for bed
-        i = 0
-        for t in self.BedTempList:
-            x = self.graph_area_left + i
-            y = self.graph_area_top + self.graph_area_height - int(t * g_scale)
-            pygame.draw.line(self.screen, (0, 0, 220), [x, y], [x + 1, y], 2)
-            i += 1
-
-        # Draw target temperatures
-        # Hot end 
-        pygame.draw.line(self.screen, (180, 40, 40), [self.graph_area_left, self.graph_area_top + self.graph_area_height - (self.HotEndTempTarget * g_scale)], [self.graph_area_left + self.graph_area_width, self.graph_area_top + self.graph_area_height - (self.HotEndTempTarget * g_scale)], 1);
-        # Bed
-        pygame.draw.line(self.screen, (40, 40, 180), [self.graph_area_left, self.graph_area_top + self.graph_area_height - (self.BedTempTarget * g_scale)], [self.graph_area_left + self.graph_area_width, self.graph_area_top + self.graph_area_height - (self.BedTempTarget * g_scale)], 1);
-            
-        
-        # update screen
-        pygame.display.update()
+        pygame.draw.line(background, (0, 0, 0), [self.graph_area_left, self.graph_area_top + self.graph_area_height], [self.graph_area_left + self.graph_area_width, self.graph_area_top + self.graph_area_height], 2)
+
+        # Same pixel format as the screen, so blitting it is a plain copy
+        return background.convert(self.screen)
 
     def _home_xy(self):
         data = { "command": "home", "axes": ["x", "y"] }
 
         # Send command
-        self._sendAPICommand(self.apiurl_printhead, data)
+        self._sendAPICommand(self.apipath_printhead, data)
 
         return
 
@@ -482,7 +1355,7 @@ class OctoPiPanel():
         data = { "command": "home", "axes": ["z"] }
 
         # Send command
-        self._sendAPICommand(self.apiurl_printhead, data)
+        self._sendAPICommand(self.apipath_printhead, data)
 
         return
 
@@ -490,7 +1363,7 @@ class OctoPiPanel():
         data = { "command": "jog", "x": 0, "y": 0, "z": 10 }
 
         # Send command
-        self._sendAPICommand(self.apiurl_printhead, data)
+        self._sendAPICommand(self.apipath_printhead, data)
 
         return
 
@@ -498,7 +1371,7 @@ class OctoPiPanel():
         data = { "command": "extrude", "amount": 10 }
 
         # Send command
-        self._sendAPICommand(self.apiurl_printhead, data)
+        self._sendAPICommand(self.apipath_printhead, data)
 
         return
 
@@ -519,7 +1392,7 @@ class OctoPiPanel():
             data = { "command": "target", "targets": { "tool0": 210 } }
 
         # Send command
-        self._sendAPICommand(self.apiurl_tool, data)
+        self._sendAPICommand(self.apipath_tool, data)
 
         return
 
@@ -528,7 +1401,7 @@ class OctoPiPanel():
         data = { "command": "start" }
 
         # Send command
-        self._sendAPICommand(self.apiurl_job, data)
+        self._sendAPICommand(self.apipath_job, data)
 
         return
 
@@ -537,19 +1410,63 @@ class OctoPiPanel():
         data = { "command": "cancel" }
 
         # Send command
-        self._sendAPICommand(self.apiurl_job, data)
+        self._sendAPICommand(self.apipath_job, data)
 
         return
 
+    def _open_files(self):
+        # The listing is fetched or revalidated in the background, the cached one shows meanwhile
+        self.printer.files.refresh()
+        if self.filesPrinter is not self.printer:
+            self.filesPrinter = self.printer
+            self.fileTop = 0
+            self.fileSelected = None
+            self.filesVersion = None
+        self._show_screen(SCREEN_FILES)
+        self.filesDirty = True
+
+    def _open_preview(self):
+        self._show_screen(SCREEN_PREVIEW)
+        self.previewDirty = True
+
+    def _open_camera(self):
+        self._show_screen(SCREEN_CAMERA)
+        self.cameraDirty = True
+
+    def _overview_up(self):
+        self.overviewTop = max(0, self.overviewTop - self.overview_rows)
+
+    def _overview_down(self):
+        self.overviewTop = min(self.overviewTop + self.overview_rows, len(self.printers) - 1)
+
+    def _files_up(self):
+        self.fileTop = max(0, self.fileTop - (self.file_rows - 1))
+        self.filesDirty = True
+
+    def _files_down(self):
+        self.fileTop = max(0, min(self.fileTop + self.file_rows - 1, len(self.printer.files.entries) - self.file_rows))
+        self.filesDirty = True
+
+    def _load_file(self):
+        # Select the file for printing, Start on the detail screen prints it
+        for entry in self.printer.files.entries:
+            if entry.path == self.fileSelected:
+                path = "/api/files/{0}/{1}".format(entry.origin, urllib.quote(entry.path.encode('utf-8')))
+                self._sendAPICommand(path, { "command": "select" })
+                break
+
+        self._show_screen(SCREEN_DETAIL)
+
     # Pause or resume print
     def _pause_print(self):
         data = { "command": "pause" }
 
         # Send command
-        self._sendAPICommand(self.apiurl_job, data)
+        self._sendAPICommand(self.apipath_job, data)
 
         return
         
+    # GPIO button actions, run on the main loop by GpioInput
     def _button_clicked(self, button):
         if button == self.gpioButtons[0]:
             if not (self.Printing or self.Paused):
@@ -571,6 +1488,10 @@ class OctoPiPanel():
 
         return
 
+    def _button_held(self):
+        if self.Printing or self.Paused:
+            self._pause_print()
+
     # Shutdown system
     def _shutdown(self):
         if platform.system() == 'Linux':
@@ -581,10 +1502,9 @@ class OctoPiPanel():
 
         return
 
-    # Send API-data to OctoPrint
-    def _sendAPICommand(self, url, data):
-        headers = { 'content-type': 'application/json', 'X-Api-Key': self.apikey }
-        r = requests.post(url, data=json.dumps(data), headers=headers)
+    # Queue API-data to be sent to OctoPrint, never blocks
+    def _sendAPICommand(self, path, data):
+        self.commands.put(path, data)
 
 if __name__ == '__main__':
     opp = OctoPiPanel("OctoPiPanel!")
@@ -0,0 +1,56 @@
+"""
+Backlight switches the display backlight through its sysfs brightness file.
+The file is opened once and kept open, so toggling the backlight is a single
+write instead of spawning a shell.
+"""
+
+BACKLIGHT_PATH = "/sys/class/backlight/soc:backlight/brightness"
+
+
+class Backlight(object):
+    """
+    @var on: True while the backlight is on
+    @param path: brightness file, or None when there is no backlight to control
+    """
+
+    def __init__(self, path=BACKLIGHT_PATH):
+        self.on = True
+        self._file = None
+        if path is None:
+            # No backlight to control, just track the state
+            return
+
+        try:
+            self._file = open(path, "w")
+        except IOError as e:
+            # Not a Pi with a backlight, or no permission, just track the state
+            print "No backlight control ({0})".format(e.strerror)
+            self._file = None
+
+        # Start with the backlight on
+        self._write('1')
+
+    def set(self, on):
+        if on == self.on:
+            return
+
+        self.on = on
+        self._write('1' if on else '0')
+
+    def _write(self, value):
+        if self._file is None:
+            return
+
+        try:
+            self._file.seek(0)
+            self._file.write(value)
+            self._file.flush()
+        except IOError as e:
+            print "Backlight write failed: {0}".format(e.strerror)
+
+    def close(self):
+        # Never leave the display dark
+        self._write('1')
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,260 @@
+"""
+Minimal fake OctoPrint REST server for benchmarks, with configurable
+response latency and failure injection. It answers the endpoints
+OctoPiPanel polls, records every command it receives and can stand in for
+the webcam with a fixed snapshot. With push on it also serves OctoPrint's
+push socket, a plain websocket at /sockjs/websocket sending "current"
+messages, so the push path can be benchmarked without a real OctoPrint.
+"""
+
+import json
+import math
+import time
+import base64
+import select
+import random
+import struct
+import hashlib
+import threading
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+from collections import defaultdict
+
+
+# Appended to the client's key in the websocket handshake, from RFC 6455
+_WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+# Pushed hot end target and file name, polls report 200 and benchmark.gcode
+PUSH_HOTEND = 215.0
+PUSH_FILE = "push.gcode"
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        fake = self.server.fake
+        path = self.path.split('?')[0]
+        fake.count(path)
+        if path == '/sockjs/websocket' and fake.push:
+            return self._pushSocket()
+
+        if not fake._delay():
+            return self._send(500, {"error": "injected failure"})
+
+        if path == '/webcam/' and fake.snapshot is not None:
+            return self._sendBytes(200, 'image/jpeg', fake.snapshot)
+
+        body = fake.respond(path)
+        if body is None:
+            return self._send(404, {"error": "not found"})
+        self._send(200, body)
+
+    def do_POST(self):
+        fake = self.server.fake
+        length = int(self.headers.getheader('content-length') or 0)
+        data = json.loads(self.rfile.read(length) or '{}')
+
+        # The push client logs in passively to authenticate its socket
+        if self.path == '/api/login':
+            return self._send(200, { "name": "benchmark", "session": "BENCHMARKSESSION" })
+
+        fake.record(self.path, data)
+
+        if not fake._delay():
+            return self._send(500, {"error": "injected failure"})
+        self._send(204, None)
+
+    def _send(self, status, body):
+        self._sendBytes(status, 'application/json', json.dumps(body) if body is not None else '')
+
+    def _pushSocket(self):
+        """Accept the websocket handshake, then send a "current" message every pushinterval seconds."""
+        fake = self.server.fake
+        key = self.headers.getheader('Sec-WebSocket-Key')
+        if not key:
+            return self._send(400, {"error": "not a websocket request"})
+
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', base64.b64encode(hashlib.sha1(key + _WEBSOCKET_GUID).digest()))
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = 1
+
+        self._sendFrame(json.dumps({ "connected": { "version": "fake" } }))
+        while not fake._stopped:
+            # Take in what the client sends meanwhile, its auth message or a close
+            readable, writable, failed = select.select([self.connection], [], [], fake.pushinterval)
+            if readable:
+                opcode, payload = self._readFrame()
+                if opcode is None or opcode == 0x8:
+                    return
+                if opcode == 0x1:
+                    fake.pushReceived(json.loads(payload))
+                continue
+
+            self._sendFrame(json.dumps({ "current": fake.current() }))
+
+    def _sendFrame(self, payload):
+        # Server frames are never masked
+        header = chr(0x81)
+        if len(payload) < 126:
+            header += chr(len(payload))
+        elif len(payload) < 65536:
+            header += chr(126) + struct.pack('>H', len(payload))
+        else:
+            header += chr(127) + struct.pack('>Q', len(payload))
+        self.wfile.write(header + payload)
+        self.wfile.flush()
+
+    def _readFrame(self):
+        """(opcode, payload) of one frame from the client, (None, None) if the connection closed."""
+        header = self._receive(2)
+        if header is None:
+            return None, None
+        opcode, length = ord(header[0]) & 0x0f, ord(header[1]) & 0x7f
+        if length == 126:
+            length = struct.unpack('>H', self._receive(2) or '\0\0')[0]
+        elif length == 127:
+            length = struct.unpack('>Q', self._receive(8) or '\0' * 8)[0]
+
+        # Client frames are always masked
+        mask = self._receive(4) if ord(header[1]) & 0x80 else '\0' * 4
+        payload = self._receive(length) if length else ''
+        if mask is None or payload is None:
+            return None, None
+        return opcode, ''.join(chr(ord(c) ^ ord(mask[i % 4])) for i, c in enumerate(payload))
+
+    def _receive(self, size):
+        data = ''
+        while len(data) < size:
+            chunk = self.connection.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _sendBytes(self, status, contentType, payload):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeOctoPrint(object):
+    """
+    @var latency: seconds every response is delayed
+    @var failurerate: fraction of requests answered with a 500
+    @var state: connection state reported, e.g. "Operational" or "Printing"
+    @var snapshot: image data served as /webcam/?action=snapshot, or None
+    @var push: serve the push socket at /sockjs/websocket
+    @var pushinterval: seconds between two "current" messages on the push socket
+    @var pushSent: "current" messages sent over all push sockets
+    @var pushAuth: auth message the last push client sent, or None
+    """
+
+    def __init__(self, latency=0.0, failurerate=0.0, port=0):
+        self.latency = latency
+        self.failurerate = failurerate
+        self.state = "Operational"
+        self.snapshot = None
+        self.push = False
+        self.pushinterval = 0.5
+        self.pushSent = 0
+        self.pushAuth = None
+        self._stopped = False
+
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.commands = []  # (time received, path, data)
+
+        self._server = _Server(('127.0.0.1', port), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="FakeOctoPrint")
+        self._thread.daemon = True
+
+    @property
+    def baseurl(self):
+        return 'http://{0}:{1}'.format(*self._server.server_address)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, path):
+        # Only GETs are counted, commands are in self.commands
+        with self._lock:
+            self.requests[path] += 1
+
+    def _delay(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return random.random() >= self.failurerate
+
+    def record(self, path, data):
+        with self._lock:
+            self.commands.append((time.time(), path, data))
+
+    def pushReceived(self, message):
+        if 'auth' in message:
+            self.pushAuth = message['auth']
+
+    def current(self):
+        """
+        A push "current" message. Like OctoPrint's, every other one carries
+        no temperatures, the panel has to keep the last ones it got. Pushed
+        values differ from polled ones, so the benchmark can tell where the
+        panel's state came from.
+        """
+        with self._lock:
+            self.pushSent += 1
+            sent = self.pushSent
+
+        wave = math.sin(time.time() / 5.0)
+        temps = []
+        if sent % 2:
+            temps.append({
+                "time": int(time.time()),
+                "tool0": { "actual": PUSH_HOTEND + 5.0 * wave, "target": PUSH_HOTEND },
+                "bed": { "actual": 60.0 + wave, "target": 60.0 },
+            })
+        return {
+            "state": { "text": self.state },
+            "job": { "file": { "name": PUSH_FILE, "origin": "local", "path": PUSH_FILE } },
+            "progress": { "completion": 50.0 + 10.0 * wave, "printTimeLeft": 3600, "filepos": 1000 },
+            "temps": temps,
+        }
+
+    def respond(self, path):
+        # Temperatures wander so the panel has something to redraw
+        wave = math.sin(time.time() / 5.0)
+        if path == '/api/printer':
+            return {
+                "temperature": {
+                    "tool0": { "actual": 200.0 + 5.0 * wave, "target": 200.0 },
+                    "bed": { "actual": 60.0 + wave, "target": 60.0 },
+                },
+            }
+        if path == '/api/job':
+            return {
+                "job": { "file": { "name": "benchmark.gcode" } },
+                "progress": { "completion": 50.0 + 10.0 * wave, "printTimeLeft": 3600 },
+            }
+        if path == '/api/connection':
+            return { "current": { "state": self.state } }
+        return None
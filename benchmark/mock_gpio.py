@@ -0,0 +1,77 @@
+"""
+Stand-in for RPi.GPIO so OctoPiPanel can run on a machine without GPIO.
+Install it with install() before importing OctoPiPanel, then use press(),
+release() or trigger() to simulate a button on a pin.
+"""
+
+import sys
+import types
+
+BCM = 11
+BOARD = 10
+IN = 1
+OUT = 0
+PUD_UP = 22
+PUD_DOWN = 21
+FALLING = 32
+RISING = 31
+BOTH = 33
+
+_callbacks = {}
+_levels = {}
+
+
+def setmode(mode):
+    pass
+
+
+def setup(channel, direction, pull_up_down=None, initial=None):
+    pass
+
+
+def add_event_detect(channel, edge, callback=None, bouncetime=None):
+    if callback is not None:
+        _callbacks[channel] = callback
+
+
+def remove_event_detect(channel):
+    _callbacks.pop(channel, None)
+
+
+def input(channel):
+    return _levels.get(channel, 1)
+
+
+def cleanup(channel=None):
+    _callbacks.clear()
+    _levels.clear()
+
+
+def _edge(channel, level):
+    """Set the level of a pin and call its edge callback, like RPi.GPIO's callback thread would."""
+    _levels[channel] = level
+    callback = _callbacks.get(channel)
+    if callback is not None:
+        callback(channel)
+
+
+def press(channel):
+    _edge(channel, 0)
+
+
+def release(channel):
+    _edge(channel, 1)
+
+
+def trigger(channel):
+    """A short tap, a falling edge followed by a rising one."""
+    press(channel)
+    release(channel)
+
+
+def install():
+    """Make "import RPi.GPIO" return this module."""
+    package = types.ModuleType('RPi')
+    package.GPIO = sys.modules[__name__]
+    sys.modules['RPi'] = package
+    sys.modules['RPi.GPIO'] = sys.modules[__name__]
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""
+Headless OctoPiPanel benchmark.
+
+Runs the real panel under SDL's dummy video driver, with a mock RPi.GPIO and
+a local fake OctoPrint server, while a thread taps the "Z +10" button. Reports
+per-frame update()/draw() timings, polls per second, touch-to-command latency
+and CPU use. Exits non-zero when --max-frame-ms is exceeded, so it can run in
+CI on a plain Linux box. With --push state arrives over the fake push socket
+instead, and the run fails unless the pushed state reached the panel:
+
+    python benchmark/run_benchmark.py --duration 20 --latency 0.05 --max-frame-ms 15
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+# Must be set before pygame initializes the display
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+benchmarkDirectory = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(benchmarkDirectory))
+
+import mock_gpio
+mock_gpio.install()
+
+import pygame
+import OctoPiPanel
+from fakeoctoprint import FakeOctoPrint, PUSH_FILE, PUSH_HOTEND
+
+
+def percentiles(values):
+    if not values:
+        return { "n": 0, "p50": 0.0, "p95": 0.0, "max": 0.0 }
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(p * len(values)))]
+    return { "n": len(values), "p50": pick(0.50), "p95": pick(0.95), "max": values[-1] }
+
+
+def timed(samples, method):
+    def wrapper(*args, **kwargs):
+        start = time.time()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            samples.append((time.time() - start) * 1000.0)
+    return wrapper
+
+
+def writeSettings(baseurl, args):
+    settings = tempfile.NamedTemporaryFile(prefix="octopipanel-bench-", suffix=".cfg", delete=False)
+    settings.write("[settings]\n")
+    settings.write("baseurl = {0}\n".format(baseurl))
+    settings.write("apikey = BENCHMARK\n")
+    settings.write("updatetime = {0}\n".format(args.updatetime))
+    settings.write("backlightofftime = 0\n")
+    settings.write("maxfps = {0}\n".format(args.maxfps))
+    settings.write("window_width = {0}\n".format(args.width))
+    settings.write("window_height = {0}\n".format(args.height))
+    settings.write("historyfile = {0}\n".format(os.path.join(tempfile.gettempdir(), "octopipanel-bench.history")))
+
+    if args.framebuffer:
+        settings.write("framebuffer = {0}\n".format(args.framebuffer))
+
+    if args.push:
+        settings.write("push = true\n")
+
+    if args.webcam:
+        settings.write("webcam_interval = {0}\n".format(args.webcam_interval))
+
+    # More printers, all served by the same fake OctoPrint
+    for index in range(1, args.printers):
+        settings.write("\n[printer Bench {0}]\n".format(index + 1))
+        settings.write("baseurl = {0}\n".format(baseurl))
+        settings.write("apikey = BENCHMARK\n")
+    settings.close()
+    return settings.name
+
+
+def tagged(put, path):
+    """
+    Wrap CommandQueue.put so every command sent to path carries the number
+    of the tap that queued it. Taps are handled in order, so the n-th such
+    command comes from the n-th tap. A command merged with later taps keeps
+    the number of the first one.
+    """
+    queued = [0]
+    def wrapper(commandPath, data, *args, **kwargs):
+        if commandPath == path:
+            data = dict(data, benchmarkTap=queued[0])
+            queued[0] += 1
+        return put(commandPath, data, *args, **kwargs)
+    return wrapper
+
+
+def tapper(panel, button, interval, taps, stop):
+    """Tap a button like a finger would, remembering when each tap ended."""
+    pos = button.rect.center
+    while not stop.wait(interval):
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1))
+        pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONUP, pos=pos, button=1))
+        taps.append(time.time())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless OctoPiPanel benchmark")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run")
+    parser.add_argument('--latency', type=float, default=0.0, help="fake OctoPrint response latency in seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="fraction of requests failing with a 500")
+    parser.add_argument('--updatetime', type=int, default=2000)
+    parser.add_argument('--maxfps', type=int, default=20)
+    parser.add_argument('--width', type=int, default=320)
+    parser.add_argument('--height', type=int, default=240)
+    parser.add_argument('--printers', type=int, default=1, help="number of printers the panel monitors")
+    parser.add_argument('--framebuffer', help="draw into this file as if it were /dev/fb0")
+    parser.add_argument('--push', action='store_true', help="receive state over the fake push socket instead of polling")
+    parser.add_argument('--webcam', action='store_true', help="show the Camera screen, with the repo's screenshot as the snapshot")
+    parser.add_argument('--webcam-interval', type=int, default=200, help="ms between webcam snapshots")
+    parser.add_argument('--tap-interval', type=float, default=1.0, help="seconds between button taps, 0 disables")
+    parser.add_argument('--json', help="also write the report to this file")
+    parser.add_argument('--max-frame-ms', type=float, help="fail if the p95 update()+draw() time is above this")
+    args = parser.parse_args()
+
+    fake = FakeOctoPrint(args.latency, args.failure_rate)
+    fake.push = args.push
+    if args.webcam:
+        with open(os.path.join(os.path.dirname(benchmarkDirectory), "screenshot.jpg"), "rb") as snapshotFile:
+            fake.snapshot = snapshotFile.read()
+    fake.start()
+
+    # A plain file stands in for the framebuffer, FramebufferOutput sizes it but won't create it
+    if args.framebuffer and not os.path.exists(args.framebuffer):
+        open(args.framebuffer, "wb").close()
+
+    OctoPiPanel.OctoPiPanel.settingsFilePath = writeSettings(fake.baseurl, args)
+    panel = OctoPiPanel.OctoPiPanel("OctoPiPanel benchmark")
+
+    # The panel falls back to SDL if the framebuffer can't be used, the benchmark must not
+    if args.framebuffer and panel.framebuffer is None:
+        fake.stop()
+        os.remove(OctoPiPanel.OctoPiPanel.settingsFilePath)
+        print "FAIL: framebuffer {0} could not be used".format(args.framebuffer)
+        sys.exit(1)
+
+    # Tap buttons on the detail screen of the first printer, or watch its webcam
+    if args.webcam:
+        panel._show_screen(OctoPiPanel.SCREEN_CAMERA)
+    else:
+        panel._show_screen(OctoPiPanel.SCREEN_DETAIL)
+
+    drawTimes = []
+    updateTimes = []
+    panel.draw = timed(drawTimes, panel.draw)
+    panel.update = timed(updateTimes, panel.update)
+
+    stop = threading.Event()
+    taps = []
+    panel.commands.put = tagged(panel.commands.put, OctoPiPanel.OctoPiPanel.apipath_printhead)
+    if args.tap_interval > 0:
+        tapThread = threading.Thread(target=tapper, args=(panel, panel.btnZUp, args.tap_interval, taps, stop))
+        tapThread.daemon = True
+        tapThread.start()
+
+    quitTimer = threading.Timer(args.duration, lambda: pygame.event.post(pygame.event.Event(pygame.QUIT)))
+    quitTimer.start()
+
+    cpuStart = sum(os.times()[:2])
+    started = time.time()
+    panel.Start()
+    elapsed = time.time() - started
+    cpu = sum(os.times()[:2]) - cpuStart
+
+    # Pushed state, merged over messages without temperatures, must be what the panel shows
+    state = panel.printer.poller.latest()
+    pushed = state.FileName == PUSH_FILE and abs(state.HotEndTemp - PUSH_HOTEND) <= 5.0
+
+    stop.set()
+    fake.stop()
+    os.remove(OctoPiPanel.OctoPiPanel.settingsFilePath)
+
+    # Match every tap with the first arrival of the jog it produced, lost and resent jogs don't shift the rest
+    arrived = {}
+    for received, path, data in fake.commands:
+        tap = data.get('benchmarkTap')
+        if path == OctoPiPanel.OctoPiPanel.apipath_printhead and tap is not None and tap not in arrived:
+            arrived[tap] = received
+    touchLatency = [(received - taps[tap]) * 1000.0 for tap, received in sorted(arrived.items()) if tap < len(taps)]
+
+    frameTimes = [u + d for u, d in zip(updateTimes, drawTimes)]
+    report = {
+        "duration": elapsed,
+        "printers": args.printers,
+        "framebuffer_rows": panel.framebuffer.rowsCopied if panel.framebuffer is not None else None,
+        "push_messages": fake.pushSent if args.push else None,
+        "push_authenticated": fake.pushAuth is not None if args.push else None,
+        "push_state": pushed if args.push else None,
+        "webcam_frames": panel.printer.webcam.frameNumber if args.webcam else None,
+        "webcam_dropped": panel.printer.webcam.dropped if args.webcam else None,
+        "update_ms": percentiles(updateTimes),
+        "draw_ms": percentiles(drawTimes),
+        "frame_ms": percentiles(frameTimes),
+        "polls_per_second": dict((path, count / elapsed) for path, count in fake.requests.items()),
+        "touch_to_command_ms": percentiles(touchLatency),
+        "taps": len(taps),
+        "commands": len(fake.commands),
+        "cpu_seconds": cpu,
+        "cpu_percent": 100.0 * cpu / elapsed,
+    }
+
+    print "---"
+    for key in ("update_ms", "draw_ms", "frame_ms", "touch_to_command_ms"):
+        stats = report[key]
+        print "{0:20} n={1:<6} p50={2:7.2f} p95={3:7.2f} max={4:7.2f}".format(key, stats["n"], stats["p50"], stats["p95"], stats["max"])
+    for path, rate in sorted(report["polls_per_second"].items()):
+        print "{0:20} {1:.2f}/s".format(path, rate)
+    if args.push:
+        print "{0:20} {1} messages, {2}, panel state {3}".format("push", report["push_messages"],
+            "authenticated" if report["push_authenticated"] else "not authenticated", "pushed" if pushed else "polled")
+    if args.webcam:
+        print "{0:20} {1} shown, {2} dropped".format("webcam", report["webcam_frames"], report["webcam_dropped"])
+    print "{0:20} {1:.2f}s ({2:.1f}%)".format("cpu", cpu, report["cpu_percent"])
+
+    if args.json:
+        with open(args.json, "w") as reportFile:
+            json.dump(report, reportFile, indent=2)
+
+    if args.push and not pushed:
+        print "FAIL: pushed state never reached the panel"
+        sys.exit(1)
+
+    if args.max_frame_ms is not None and report["frame_ms"]["p95"] > args.max_frame_ms:
+        print "FAIL: p95 frame time {0:.2f}ms is above {1:.2f}ms".format(report["frame_ms"]["p95"], args.max_frame_ms)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+CommandQueue sends commands to OctoPrint on a worker thread, so a button
+tap (or a GPIO callback) never waits for OctoPrint to answer.
+
+The queue is bounded. A jog or extrude that is still waiting in the queue is
+merged with the next one of the same kind, so five quick "Z +10" taps end up
+as a single 50 mm jog. Every command has a deadline and is retried until it
+runs out of retries or time, but only while it never reached OctoPrint.
+After a read timeout or a server error OctoPrint may already have run it,
+and jogs and extrudes must not run twice. The outcome of every command is
+reported to the listener.
+"""
+
+import time
+import threading
+import requests
+from requests.packages.urllib3.exceptions import NewConnectionError
+from collections import deque, namedtuple
+
+CommandResult = namedtuple('CommandResult', ['path', 'data', 'success', 'status', 'error', 'attempts'])
+
+# Commands whose values can be added up when they are queued back to back
+_MERGEABLE = {
+    'jog': ('x', 'y', 'z'),
+    'extrude': ('amount', ),
+}
+
+
+def _neverSent(error):
+    """True if a request failed before it reached the server, so sending it again can't run it twice."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        # No connection could be made, as opposed to one dropped while waiting for the answer
+        return isinstance(getattr(error.args[0], 'reason', None), NewConnectionError)
+    return False
+
+
+class _Command(object):
+    def __init__(self, path, data, deadline, retries):
+        self.path = path
+        self.data = dict(data)
+        self.deadline = deadline
+        self.retries = retries
+        self.attempts = 0
+
+    def merge(self, path, data):
+        """Add data to this command if both are the same kind of relative move."""
+        command = data.get('command')
+        if path != self.path or command != self.data.get('command') or command not in _MERGEABLE:
+            return False
+
+        for key in _MERGEABLE[command]:
+            self.data[key] = self.data.get(key, 0) + data.get(key, 0)
+        return True
+
+
+class CommandQueue(threading.Thread):
+    """
+    @var listener: callable getting a CommandResult for every finished command,
+        called on the worker thread
+    """
+
+    def __init__(self, api, maxsize=16, timeout=10.0, retries=2, retrydelay=0.5):
+        threading.Thread.__init__(self, name="CommandQueue")
+        self.daemon = True
+
+        self.api = api
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.retries = retries
+        self.retrydelay = retrydelay
+        self.listener = None
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def put(self, path, data, timeout=None, retries=None):
+        """Queue a command. Returns False if the queue is full."""
+        with self._condition:
+            if self._pending and self._pending[-1].merge(path, data):
+                return True
+
+            if len(self._pending) >= self.maxsize:
+                print "Command queue full, dropping {0}".format(data.get('command'))
+                return False
+
+            deadline = time.time() + (timeout if timeout is not None else self.timeout)
+            self._pending.append(_Command(path, data, deadline, retries if retries is not None else self.retries))
+            self._condition.notify()
+            return True
+
+    def depth(self):
+        with self._condition:
+            return len(self._pending)
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                command = self._pending.popleft()
+
+            self._report(self._send(command))
+
+    def _send(self, command):
+        status = None
+        error = None
+
+        while True:
+            remaining = command.deadline - time.time()
+            if remaining <= 0:
+                error = error or "deadline expired"
+                break
+
+            command.attempts += 1
+            try:
+                req = self.api.post(command.path, command.data, timeout=min(remaining, self.api.timeout))
+                status = req.status_code
+                if status < 300:
+                    return CommandResult(command.path, command.data, True, status, None, command.attempts)
+                error = req.text
+
+                # Refused, or it failed while running, trying again won't help or may run it twice
+                break
+            except requests.exceptions.RequestException as e:
+                error = str(e)
+                if not _neverSent(e):
+                    break
+
+            if command.attempts > command.retries:
+                break
+            time.sleep(self.retrydelay)
+
+        return CommandResult(command.path, command.data, False, status, error, command.attempts)
+
+    def _report(self, result):
+        if self.listener is not None:
+            self.listener(result)
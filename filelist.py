@@ -0,0 +1,171 @@
+"""
+FileList is the panel's copy of OctoPrint's file listing, used to pick a
+job. Nothing is fetched until the listing is first asked for. From then on
+it's kept in a local cache file, so it shows up right away after a restart,
+and refreshed on a background thread with If-None-Match: while nothing
+changed OctoPrint answers 304 and nothing is downloaded or parsed again.
+"""
+
+import os
+import json
+import time
+import threading
+import requests
+from collections import namedtuple
+
+# One printable file, entries are sorted by path
+FileEntry = namedtuple('FileEntry', ['path', 'origin', 'name', 'size', 'date', 'display'])
+
+CACHE_VERSION = 1
+
+
+def formatSize(size):
+    for unit in ("B", "kB", "MB"):
+        if size < 1024:
+            return "{0:.0f} {1}".format(size, unit) if unit == "B" else "{0:.1f} {1}".format(size, unit)
+        size /= 1024.0
+    return "{0:.1f} GB".format(size)
+
+
+def flattenFiles(files, entries):
+    """Append a FileEntry for every machine code file in an /api/files listing, folders included."""
+    for item in files:
+        if item.get('type') == 'folder':
+            flattenFiles(item.get('children', []), entries)
+        elif item.get('type', 'machinecode') == 'machinecode':
+            path = item.get('path', item['name'])
+            size = item.get('size') or 0
+            entries.append(FileEntry(path, item.get('origin', 'local'), item['name'], size, item.get('date') or 0,
+                                     u'{0}  {1}'.format(path, formatSize(size))))
+    return entries
+
+
+class FileList(threading.Thread):
+    """
+    @var entries: tuple of FileEntry, replaced as a whole when the listing changes
+    @var version: increases by one every time entries is replaced
+    @var loading: True while a listing is being fetched
+    @var error: why the last fetch failed, or None
+    @var maxage: seconds a listing is used before it's checked with OctoPrint again
+    """
+
+    def __init__(self, api, cachepath=None, maxage=30):
+        threading.Thread.__init__(self, name="FileList")
+        self.daemon = True
+
+        self.api = api
+        self.cachepath = cachepath
+        self.maxage = maxage
+
+        self.entries = ()
+        self.version = 0
+        self.loading = False
+        self.error = None
+
+        self._etag = None
+        self._checked = 0.0
+        self._requested = False
+        self._cacheLoaded = False
+        self._wakeEvent = threading.Event()
+        self._stopped = False
+
+        # Optional callable, called on this thread whenever entries, loading or error changed
+        self.listener = None
+
+    def refresh(self):
+        """Ask for an up to date listing, fetched in the background if the one we have is too old."""
+        self._requested = True
+        self._wakeEvent.set()
+
+    def invalidate(self):
+        """Files changed on the server, check again before the listing is used next."""
+        self._checked = 0.0
+        if self._requested:
+            self._wakeEvent.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeEvent.set()
+
+    def run(self):
+        while not self._stopped:
+            self._wakeEvent.wait()
+            self._wakeEvent.clear()
+            if self._stopped:
+                break
+
+            # The cached listing is good enough to show while it's being revalidated
+            if not self._cacheLoaded:
+                self._cacheLoaded = True
+                self._loadCache()
+
+            if time.time() - self._checked >= self.maxage:
+                self._fetch()
+
+    def _publish(self, entries=None):
+        if entries is not None:
+            self.entries = tuple(entries)
+            self.version += 1
+        if self.listener is not None:
+            self.listener()
+
+    def _fetch(self):
+        self.loading = True
+        self._publish()
+
+        headers = {}
+        if self._etag is not None and self.entries:
+            headers['If-None-Match'] = self._etag
+
+        entries = None
+        try:
+            req = self.api.get('/api/files?recursive=true', headers=headers)
+            if req.status_code == 304:
+                # Nothing changed, keep what we have
+                self.error = None
+            elif req.status_code == 200:
+                entries = flattenFiles(req.json().get('files', []), [])
+                entries.sort(key=lambda entry: entry.path.lower())
+                self._etag = req.headers.get('ETag')
+                self.error = None
+            else:
+                self.error = "HTTP {0}".format(req.status_code)
+            self._checked = time.time()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.error = str(e)
+
+        self.loading = False
+        self._publish(entries)
+
+        if entries is not None:
+            self._saveCache(entries)
+
+    def _loadCache(self):
+        if self.cachepath is None or not os.path.exists(self.cachepath):
+            return
+
+        try:
+            with open(self.cachepath, "r") as cacheFile:
+                cache = json.load(cacheFile)
+            if cache.get("version") != CACHE_VERSION or cache.get("baseurl") != self.api.baseurl:
+                return
+            entries = [FileEntry(*entry) for entry in cache["files"]]
+        except (IOError, ValueError, KeyError, TypeError) as e:
+            print "Ignoring file list cache {0}: {1}".format(self.cachepath, e)
+            return
+
+        self._etag = cache.get("etag")
+        self._publish(entries)
+
+    def _saveCache(self, entries):
+        if self.cachepath is None:
+            return
+
+        cache = { "version": CACHE_VERSION, "baseurl": self.api.baseurl, "etag": self._etag, "files": entries }
+        temporary = self.cachepath + ".tmp"
+        try:
+            with open(temporary, "w") as cacheFile:
+                json.dump(cache, cacheFile)
+            os.rename(temporary, self.cachepath)
+        except (IOError, OSError) as e:
+            print "Could not write file list cache {0}: {1}".format(self.cachepath, e)
@@ -0,0 +1,114 @@
+"""
+FramebufferOutput puts OctoPiPanel's frames straight into a memory-mapped
+Linux framebuffer device. Everything is drawn on a surface that already has
+the framebuffer's pixel format, e.g. RGB565, and update() copies only the
+rows covered by damaged rects. That skips the format conversion and full
+frame copy SDL's fbcon driver does on every display update. A regular file
+can stand in for /dev/fb0.
+"""
+
+import os
+import mmap
+import pygame
+
+SYSFS_GRAPHICS = "/sys/class/graphics"
+
+
+def framebufferGeometry(path):
+    """(width, height, bits per pixel, stride) of a /dev/fbN device from sysfs, or None."""
+    sysfs = os.path.join(SYSFS_GRAPHICS, os.path.basename(path))
+    try:
+        with open(os.path.join(sysfs, "virtual_size")) as sizeFile:
+            width, height = [int(v) for v in sizeFile.read().split(",")]
+        with open(os.path.join(sysfs, "bits_per_pixel")) as depthFile:
+            depth = int(depthFile.read())
+        with open(os.path.join(sysfs, "stride")) as strideFile:
+            stride = int(strideFile.read())
+    except (IOError, ValueError):
+        return None
+    return width, height, depth, stride
+
+
+class FramebufferOutput(object):
+    """
+    @var surface: draw here, it has the framebuffer's pixel format
+    @var stride: bytes per framebuffer row
+    @var rowsCopied: rows copied to the framebuffer so far
+    @param depth: bits per pixel, 16 or 32. Read from sysfs for a real device
+                  when None, 16 for anything else.
+    """
+
+    def __init__(self, path, size, depth=None, stride=None):
+        geometry = framebufferGeometry(path)
+        if geometry is not None:
+            if size[0] > geometry[0] or size[1] > geometry[1]:
+                raise ValueError("{0}x{1} doesn't fit on the {2}x{3} framebuffer".format(size[0], size[1], geometry[0], geometry[1]))
+            if depth is None:
+                depth = geometry[2]
+            if stride is None:
+                stride = geometry[3]
+
+        if depth is None:
+            depth = 16
+        if depth not in (16, 32):
+            raise ValueError("{0} bits per pixel framebuffers are not supported".format(depth))
+        if stride is None:
+            stride = size[0] * depth // 8
+
+        self.path = path
+        self.size = size
+        self.depth = depth
+        self.stride = stride
+        self.rowsCopied = 0
+
+        length = stride * size[1]
+        self._file = open(path, "r+b")
+        if os.path.isfile(path) and os.path.getsize(path) < length:
+            # A regular file standing in for the device, make it as big as one
+            self._file.truncate(length)
+        self._map = mmap.mmap(self._file.fileno(), length)
+
+        # Default masks are RGB565 for 16 bits and XRGB8888 for 32, like the framebuffer
+        self.surface = pygame.Surface(size, 0, depth)
+
+    def _rowSpans(self, rects):
+        """Sorted, non-overlapping (top, bottom) row ranges covered by rects."""
+        bounds = self.surface.get_rect()
+        spans = []
+        for rect in sorted((bounds.clip(rect) for rect in rects), key=lambda rect: rect.top):
+            if rect.width == 0 or rect.height == 0:
+                continue
+            if spans and rect.top <= spans[-1][1]:
+                spans[-1][1] = max(spans[-1][1], rect.bottom)
+            else:
+                spans.append([rect.top, rect.bottom])
+        return spans
+
+    def update(self, rects):
+        """Copy the rows covered by rects from the surface to the framebuffer."""
+        spans = self._rowSpans(rects)
+        if not spans:
+            return
+
+        pitch = self.surface.get_pitch()
+        rowBytes = self.size[0] * self.surface.get_bytesize()
+
+        # Locks the surface until it's released again below
+        pixels = self.surface.get_buffer()
+        try:
+            for top, bottom in spans:
+                if pitch == self.stride:
+                    # Same row layout, the whole span is one copy
+                    self._map.seek(top * pitch)
+                    self._map.write(buffer(pixels, top * pitch, (bottom - top) * pitch))
+                else:
+                    for row in range(top, bottom):
+                        self._map.seek(row * self.stride)
+                        self._map.write(buffer(pixels, row * pitch, rowBytes))
+                self.rowsCopied += bottom - top
+        finally:
+            del pixels
+
+    def close(self):
+        self._map.close()
+        self._file.close()
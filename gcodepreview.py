@@ -0,0 +1,455 @@
+"""
+Layer preview of G-code files. LayerIndexBuilder parses G-code as it's
+streamed, one line at a time, and writes a compact index file: for every
+layer its Z, the byte range of the file it covers and its extrusion moves,
+downsampled to a bounded number of segments. Memory use doesn't depend on
+the size of the file, only the layer being parsed is held.
+
+LayerIndex reads such a file, keeping only the small layer table in memory
+and loading the segments of one layer when asked. The file stays open, so
+it can still be read after it was pruned from the cache. LayerPreview finds or
+builds the index of a job's file on a background thread, keyed by the file's
+hash, so a file is downloaded and parsed only once.
+"""
+
+import os
+import glob
+import json
+import struct
+import urllib
+import hashlib
+import threading
+import requests
+from array import array
+from bisect import bisect_right
+
+MAGIC = 'OPPL'
+VERSION = 1
+
+# magic, version, number of layers, offset of the layer table, min x, min y, max x, max y
+HEADER = struct.Struct('<4sIIQffff')
+
+# z, first byte, byte after the last one, offset of the segments, number of segments
+LAYER = struct.Struct('<fQQQI')
+
+# Segments are x0, y0, x1, y1 in tenths of a millimeter
+SEGMENT_SIZE = 4 * array('h').itemsize
+
+# Seconds before a build that failed on a transient error is tried again, doubling up to RETRY_MAX
+RETRY_DELAY = 10
+RETRY_MAX = 300
+
+_MOVES = ('G0', 'G1', 'G2', 'G3', 'G00', 'G01', 'G02', 'G03')
+
+
+def _transient(error):
+    """True for failures worth trying again later: timeouts, lost connections and server errors."""
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+        return True
+    response = getattr(error, 'response', None)
+    return isinstance(error, requests.exceptions.HTTPError) and response is not None and response.status_code >= 500
+
+
+def _tenths(value):
+    return max(-32767, min(32767, int(round(value * 10))))
+
+
+class LayerIndexBuilder(object):
+    """
+    @var resolution: mm an extrusion path must move before a segment is kept
+    @var maxSegments: segments kept per layer, longer layers are thinned out
+    @var minLayerHeight: mm Z must change by before extrusion starts a new layer
+    """
+
+    def __init__(self, path, resolution=0.5, maxSegments=4000, minLayerHeight=0.05):
+        self.resolution = resolution
+        self.maxSegments = maxSegments
+        self.minLayerHeight = minLayerHeight
+
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0.0, 0.0, 0.0, 0.0))
+        self._layers = []
+        self._bounds = None
+
+        # Parser state
+        self._base = 0          # file offset of the first byte of _partial
+        self._partial = ''
+        self._x = self._y = self._z = self._e = 0.0
+        self._absolute = True
+        self._absoluteE = True
+
+        # Layer being built
+        self._layerZ = None
+        self._layerStart = 0
+        self._segments = array('h')
+        self._stride = 1        # keep every stride-th segment once a layer got too long
+        self._count = 0
+        self._anchor = None     # start of the segment being extended
+        self._pending = None    # end of it, not yet resolution away from the anchor
+
+    def feed(self, chunk):
+        """Parse the next chunk of the file."""
+        data = self._partial + chunk
+        start = 0
+        while True:
+            end = data.find('\n', start)
+            if end < 0:
+                break
+            self._line(data[start:end], self._base + start)
+            start = end + 1
+
+        self._base += start
+        self._partial = data[start:]
+
+    def close(self):
+        """Parse what's left and write the layer table, the index is complete after this."""
+        if self._partial:
+            self._line(self._partial, self._base)
+            self._base += len(self._partial)
+            self._partial = ''
+        self._finishLayer(self._base)
+
+        tableOffset = self._file.tell()
+        for layer in self._layers:
+            self._file.write(LAYER.pack(*layer))
+
+        bounds = self._bounds or (0.0, 0.0, 0.0, 0.0)
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, len(self._layers), tableOffset, *bounds))
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+
+    def _line(self, line, offset):
+        line = line.lstrip()
+        if not line or line[0] not in 'GMgm':
+            return
+
+        comment = line.find(';')
+        if comment >= 0:
+            line = line[:comment]
+        words = line.split()
+        if not words:
+            return
+
+        code = words[0].upper()
+        if code in _MOVES:
+            self._move(words[1:], offset)
+        elif code == 'G90':
+            self._absolute = self._absoluteE = True
+        elif code == 'G91':
+            self._absolute = self._absoluteE = False
+        elif code == 'M82':
+            self._absoluteE = True
+        elif code == 'M83':
+            self._absoluteE = False
+        elif code == 'G92':
+            for word in words[1:]:
+                value = self._value(word)
+                if value is None:
+                    continue
+                axis = word[0].upper()
+                if axis == 'X':
+                    self._x = value
+                elif axis == 'Y':
+                    self._y = value
+                elif axis == 'Z':
+                    self._z = value
+                elif axis == 'E':
+                    self._e = value
+        elif code == 'G28':
+            self._x = self._y = self._z = 0.0
+            self._flushPath()
+
+    def _value(self, word):
+        try:
+            return float(word[1:])
+        except ValueError:
+            return None
+
+    def _move(self, words, offset):
+        x, y, z, e = self._x, self._y, self._z, self._e
+        extruded = 0.0
+        for word in words:
+            value = self._value(word)
+            if value is None:
+                continue
+            axis = word[0].upper()
+            if axis == 'X':
+                x = value if self._absolute else x + value
+            elif axis == 'Y':
+                y = value if self._absolute else y + value
+            elif axis == 'Z':
+                z = value if self._absolute else z + value
+            elif axis == 'E':
+                extruded = value - self._e if self._absoluteE else value
+                e = self._e + extruded
+
+        if extruded > 0 and (x != self._x or y != self._y):
+            # Extruding at another height starts a new layer
+            if self._layerZ is None or abs(z - self._layerZ) >= self.minLayerHeight:
+                self._finishLayer(offset)
+                self._layerZ = z
+                self._layerStart = offset
+            self._extrude(self._x, self._y, x, y)
+        else:
+            self._flushPath()
+
+        self._x, self._y, self._z, self._e = x, y, z, e
+
+    def _extrude(self, x0, y0, x1, y1):
+        if self._anchor is None or (self._pending or self._anchor) != (x0, y0):
+            # A new path
+            self._flushPath()
+            self._anchor = (x0, y0)
+
+        if abs(x1 - self._anchor[0]) + abs(y1 - self._anchor[1]) >= self.resolution:
+            self._addSegment(self._anchor, (x1, y1))
+            self._anchor = (x1, y1)
+            self._pending = None
+        else:
+            self._pending = (x1, y1)
+
+    def _flushPath(self):
+        if self._pending is not None:
+            self._addSegment(self._anchor, self._pending)
+        self._anchor = None
+        self._pending = None
+
+    def _addSegment(self, start, end):
+        self._count += 1
+        if self._count % self._stride:
+            return
+
+        self._segments.extend((_tenths(start[0]), _tenths(start[1]), _tenths(end[0]), _tenths(end[1])))
+        if self._bounds is None:
+            self._bounds = (start[0], start[1], start[0], start[1])
+        self._bounds = (min(self._bounds[0], start[0], end[0]), min(self._bounds[1], start[1], end[1]),
+                        max(self._bounds[2], start[0], end[0]), max(self._bounds[3], start[1], end[1]))
+
+        # Too many segments, drop every other one from here on
+        if len(self._segments) >= 4 * self.maxSegments:
+            thinned = array('h')
+            for i in range(0, len(self._segments), 8):
+                thinned.extend(self._segments[i:i + 4])
+            self._segments = thinned
+            self._stride *= 2
+
+    def _finishLayer(self, offset):
+        self._flushPath()
+        if self._layerZ is not None:
+            segmentOffset = self._file.tell()
+            self._file.write(self._segments.tostring())
+            self._layers.append((self._layerZ, self._layerStart, offset, segmentOffset, len(self._segments) // 4))
+
+        self._layerZ = None
+        self._segments = array('h')
+        self._stride = 1
+        self._count = 0
+
+
+class LayerIndex(object):
+    """
+    @var layers: (z, first byte, byte after the last, segment offset, segment count) per layer
+    @var bounds: (min x, min y, max x, max y) in mm of everything extruded
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            header = self._file.read(HEADER.size)
+            magic, version, count, tableOffset, minX, minY, maxX, maxY = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("not a layer index")
+            self._file.seek(tableOffset)
+            table = self._file.read(count * LAYER.size)
+        except (IOError, ValueError, struct.error):
+            self._file.close()
+            raise
+
+        self.layers = [LAYER.unpack_from(table, i * LAYER.size) for i in range(count)]
+        self.bounds = (minX, minY, maxX, maxY)
+        self._starts = [layer[1] for layer in self.layers]
+
+    def __len__(self):
+        return len(self.layers)
+
+    def layerAt(self, filepos):
+        """Index of the layer being printed when filepos bytes of the file were sent."""
+        return max(0, bisect_right(self._starts, filepos or 0) - 1)
+
+    def segments(self, index):
+        """Segments of one layer, a flat array of x0, y0, x1, y1 in tenths of a millimeter."""
+        z, start, end, offset, count = self.layers[index]
+        segments = array('h')
+        self._file.seek(offset)
+        segments.fromstring(self._file.read(count * SEGMENT_SIZE))
+        return segments
+
+
+class LayerPreview(threading.Thread):
+    """
+    @var index: LayerIndex of the file asked for last, None until it's ready
+    @var progress: fraction of the file parsed while its index is being built
+    @var error: why there's no index, or None
+    @var cachedir: directory the index files are kept in
+    @var maxfiles: number of index files kept, the least recently used go first
+    """
+
+    def __init__(self, api, cachedir, maxfiles=20):
+        threading.Thread.__init__(self, name="LayerPreview")
+        self.daemon = True
+
+        self.api = api
+        self.cachedir = cachedir
+        self.maxfiles = maxfiles
+
+        self.index = None
+        self.progress = 0.0
+        self.error = None
+
+        self._wanted = None
+        self._current = None
+        self._wakeEvent = threading.Event()
+        self._stopped = False
+
+        # Optional callable, called on this thread whenever index, progress or error changed
+        self.listener = None
+
+    def show(self, origin, path):
+        """Ask for the index of a file, built in the background if it isn't cached."""
+        if (origin, path) == self._wanted:
+            return
+        self._wanted = (origin, path)
+        self.index = None
+        self.error = None
+        self.progress = 0.0
+        self._wakeEvent.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeEvent.set()
+
+    def run(self):
+        failed = None       # file whose index couldn't be built
+        failures = 0
+        retryDelay = None   # seconds until it's tried again
+        while not self._stopped:
+            self._wakeEvent.wait(retryDelay)
+            self._wakeEvent.clear()
+
+            wanted = self._wanted
+            if self._stopped or wanted is None or wanted == self._current:
+                continue
+
+            self._current = wanted
+            retryDelay = None
+            if self.error is not None:
+                # Trying again, show the progress instead of the old error
+                self.error = None
+                self.progress = 0.0
+                self._publish()
+            try:
+                index = self._open(*wanted)
+            except (requests.exceptions.RequestException, IOError, OSError, ValueError, struct.error) as e:
+                if wanted != self._wanted:
+                    # Cancelled because another file was asked for
+                    self._current = None
+                    continue
+
+                self.error = str(e)
+                if not _transient(e):
+                    # E.g. a file on the SD card or a 404, stays that way until another file is asked for
+                    print "No layer preview of {0}: {1}".format(wanted[1], e)
+                    self._publish()
+                    continue
+
+                # E.g. a timeout downloading a big file, try again later
+                if wanted != failed:
+                    failed = wanted
+                    failures = 0
+                failures += 1
+                retryDelay = min(RETRY_MAX, RETRY_DELAY * 2 ** (failures - 1))
+                self._current = None
+                print "No layer preview of {0}, trying again in {1}s: {2}".format(wanted[1], retryDelay, e)
+                self._publish()
+                continue
+
+            if wanted == self._wanted:
+                failed = None
+                self.index = index
+                self._publish()
+            else:
+                # Another file was asked for meanwhile
+                self._current = None
+
+    def _publish(self):
+        if self.listener is not None:
+            self.listener()
+
+    def _url(self, prefix, origin, path):
+        return "{0}/{1}/{2}".format(prefix, origin, urllib.quote(path.encode('utf-8')))
+
+    def _open(self, origin, path):
+        if origin != 'local':
+            raise ValueError("only files stored by OctoPrint can be previewed")
+
+        # OctoPrint knows the hash of its files, index files are named by it
+        req = self.api.get(self._url('/api/files', origin, path))
+        req.raise_for_status()
+        info = json.loads(req.text)
+        key = info.get('hash')
+        if not key:
+            key = hashlib.sha1(u'{0}/{1}:{2}:{3}'.format(origin, path, info.get('size'), info.get('date')).encode('utf-8')).hexdigest()
+
+        indexPath = os.path.join(self.cachedir, key + '.layers')
+        if os.path.exists(indexPath):
+            # Recently used index files are kept longest
+            os.utime(indexPath, None)
+            return LayerIndex(indexPath)
+
+        self._build(origin, path, info.get('size'), indexPath)
+        self._prune()
+        return LayerIndex(indexPath)
+
+    def _build(self, origin, path, size, indexPath):
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+
+        temporary = "{0}.{1}.tmp".format(indexPath, id(self))
+        builder = LayerIndexBuilder(temporary)
+        parsed = 0
+        complete = False
+        try:
+            req = self.api.get(self._url('/downloads/files', origin, path), stream=True)
+            req.raise_for_status()
+            for chunk in req.iter_content(64 * 1024):
+                if self._stopped or (origin, path) != self._wanted:
+                    raise IOError("preview of {0} cancelled".format(path))
+
+                builder.feed(chunk)
+                parsed += len(chunk)
+
+                # Wake up the main loop once per percent, not once per chunk
+                if size and int(100.0 * parsed / size) != int(100.0 * self.progress):
+                    self.progress = float(parsed) / size
+                    self._publish()
+            req.close()
+            builder.close()
+            complete = True
+        finally:
+            if not complete:
+                builder.abort()
+                os.remove(temporary)
+
+        os.rename(temporary, indexPath)
+
+    def _prune(self):
+        files = sorted(glob.glob(os.path.join(self.cachedir, '*.layers')), key=os.path.getmtime)
+        for indexPath in files[:-self.maxfiles]:
+            try:
+                os.remove(indexPath)
+            except OSError:
+                pass
@@ -0,0 +1,114 @@
+"""
+GpioInput turns GPIO button edges into timestamped events for the main loop.
+RPi.GPIO's callback thread only appends the edge to a deque, which needs no
+lock, and wakes the main loop up. Debouncing, long press detection and the
+button actions all run on the main loop, where the panel state lives, so a
+slow OctoPrint can never delay or drop the next edge.
+"""
+
+import time
+from collections import deque
+
+
+class GpioInput(object):
+    """
+    @var debounce: ms after an accepted edge during which edges on the same pin are ignored
+    @var longpress: ms a button must be held for its long press action
+    @var lastLatency: ms from edge to action of the last action run
+    @var bounced: number of edges ignored as bounces
+    """
+
+    def __init__(self, gpio, debounce=50, longpress=800):
+        self.gpio = gpio
+        self.debounce = debounce
+        self.longpress = longpress
+
+        # (channel, level, timestamp), appended by RPi.GPIO's callback thread
+        self._edges = deque()
+
+        self._actions = {}    # channel -> (action, long press action or None)
+        self._lastEdge = {}   # channel -> timestamp of the last accepted edge
+        self._pressed = {}    # channel -> press timestamp while a long press is possible
+
+        # Edge to action latency bookkeeping
+        self.lastLatency = 0.0
+        self.latencies = deque(maxlen=100)
+        self.actionCount = 0
+        self.bounced = 0
+
+        # Optional PerfStats, every action's latency is recorded as "gpio"
+        self.perf = None
+
+        # Optional callable, called on RPi.GPIO's thread after an edge was queued
+        self.listener = None
+
+    def add(self, channel, action, longAction=None):
+        """
+        Watch a button pulling channel low. Without longAction, action runs as
+        soon as the button is pressed. With one, action runs when the button
+        is released early and longAction once it has been held long enough.
+        """
+        self._actions[channel] = (action, longAction)
+        self.gpio.setup(channel, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+        self.gpio.add_event_detect(channel, self.gpio.BOTH, callback=self._edge)
+
+    def _edge(self, channel):
+        # Runs on RPi.GPIO's thread, only record the edge and wake up the main loop
+        self._edges.append((channel, self.gpio.input(channel), time.time()))
+        if self.listener is not None:
+            self.listener()
+
+    def holding(self):
+        """True while a held button may still turn into a long press."""
+        return bool(self._pressed)
+
+    def process(self):
+        """Run the actions of queued edges and of buttons held long enough. Call on the main loop."""
+        while self._edges:
+            channel, level, timestamp = self._edges.popleft()
+
+            # Contacts bounce, ignore edges right after an accepted one
+            last = self._lastEdge.get(channel)
+            if last is not None and (timestamp - last) * 1000.0 < self.debounce:
+                self.bounced += 1
+                continue
+            self._lastEdge[channel] = timestamp
+
+            action, longAction = self._actions[channel]
+            if level == 0:
+                # Pressed, the pin is pulled up
+                if longAction is None:
+                    self._run(action, timestamp)
+                else:
+                    self._pressed[channel] = timestamp
+
+            elif self._pressed.pop(channel, None) is not None:
+                # Released before it became a long press
+                self._run(action, timestamp)
+
+        now = time.time()
+        for channel, start in self._pressed.items():
+            action, longAction = self._actions[channel]
+            if self.gpio.input(channel) != 0:
+                # The release edge was lost as a bounce, it was a short press
+                del self._pressed[channel]
+                self._run(action, now)
+            elif (now - start) * 1000.0 >= self.longpress:
+                del self._pressed[channel]
+                self._run(longAction, start + self.longpress / 1000.0)
+
+    def _run(self, action, timestamp):
+        action()
+
+        latency = (time.time() - timestamp) * 1000.0
+        self.lastLatency = latency
+        self.latencies.append(latency)
+        self.actionCount += 1
+        if self.perf is not None:
+            self.perf.record("gpio", latency)
+
+    def averageLatency(self):
+        """Average edge to action latency in ms of the last 100 actions."""
+        if not self.latencies:
+            return 0.0
+        return sum(self.latencies) / len(self.latencies)
@@ -0,0 +1,87 @@
+"""
+OctoPrintSession is the single way OctoPiPanel talks HTTP to OctoPrint.
+
+All traffic goes through one connection-pooled requests.Session, so TCP
+connections are kept alive between polls and commands. Several
+OctoPrintSessions, one per printer, can share a single pool made by
+sharedSession(). The API key goes with every request as an X-Api-Key header,
+every request gets a default timeout and the latency of every request is
+measured.
+"""
+
+import json
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def sharedSession(hosts=1, poolsize=4):
+    """
+    A requests.Session with a keep-alive connection pool for each of hosts
+    OctoPrint instances, poolsize connections per host.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=hosts, pool_maxsize=poolsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class OctoPrintSession(object):
+    """
+    @var baseurl: OctoPrint base url, e.g. http://localhost:5000
+    @var timeout: default timeout in seconds for every request
+    @var lastLatency: duration in ms of the last completed request
+    @param session: shared sharedSession() to send requests through, a
+                    session of its own is made and closed if None
+    """
+
+    def __init__(self, baseurl, apikey, timeout=5.0, poolsize=4, session=None):
+        self.baseurl = baseurl.rstrip('/')
+        self.timeout = timeout
+        self.headers = { 'X-Api-Key': apikey }
+
+        # Keep-alive connection pool shared by every thread using this session
+        self._ownSession = session is None
+        if session is None:
+            session = sharedSession(1, poolsize)
+        self.session = session
+
+        self.lastLatency = 0.0
+
+        # Optional PerfStats, every request is recorded as "http"
+        self.perf = None
+
+    def url(self, path):
+        return self.baseurl + path
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, data, **kwargs):
+        headers = { 'content-type': 'application/json' }
+        return self.request('POST', path, data=json.dumps(data), headers=headers, **kwargs)
+
+    def request(self, method, path, **kwargs):
+        """Send a request to OctoPrint, measuring how long it took."""
+        kwargs.setdefault('timeout', self.timeout)
+
+        # The session may be shared with other printers, send our key with each request
+        headers = dict(self.headers)
+        headers.update(kwargs.pop('headers', None) or {})
+
+        start = time.time()
+        try:
+            return self.session.request(method, self.url(path), headers=headers, **kwargs)
+        finally:
+            self._record((time.time() - start) * 1000.0)
+
+    def _record(self, latency):
+        self.lastLatency = latency
+        if self.perf is not None:
+            self.perf.record("http", latency)
+
+    def close(self):
+        # A shared session is closed by whoever made it
+        if self._ownSession:
+            self.session.close()
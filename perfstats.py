@@ -0,0 +1,89 @@
+"""
+PerfStats collects rolling timings of the main loop phases and of HTTP
+requests. While disabled measure() just calls through and record() returns
+right away, so leaving the hooks in place costs next to nothing.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+
+
+class PerfStats(object):
+    """
+    @var enabled: only collect timings while True
+    @var window: number of samples kept per timing
+    """
+
+    def __init__(self, window=200):
+        self.enabled = False
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._frames = deque(maxlen=window)
+
+    def measure(self, name, func, *args):
+        """Call func(*args), recording how long it took in ms."""
+        if not self.enabled:
+            return func(*args)
+
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            self.record(name, (time.time() - start) * 1000.0)
+
+    def record(self, name, ms):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(ms)
+
+    def frame(self):
+        """Call once for every frame sent to the display."""
+        if self.enabled:
+            self._frames.append(time.time())
+
+    def fps(self):
+        frames = list(self._frames)
+        if len(frames) < 2 or frames[-1] == frames[0]:
+            return 0.0
+        return (len(frames) - 1) / (frames[-1] - frames[0])
+
+    def percentile(self, name, p):
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return 0.0
+        return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+    def summary(self):
+        with self._lock:
+            names = list(self._samples.keys())
+
+        summary = { "fps": self.fps() }
+        for name in names:
+            summary[name] = {
+                "p50": self.percentile(name, 0.50),
+                "p95": self.percentile(name, 0.95),
+                "max": self.percentile(name, 1.0),
+            }
+        return summary
+
+    def write(self, path, extra=None):
+        """Write the summary as JSON, replacing the file in one go."""
+        summary = self.summary()
+        summary["time"] = time.time()
+        if extra:
+            summary.update(extra)
+
+        temporary = path + ".tmp"
+        with open(temporary, "w") as statsFile:
+            json.dump(summary, statsFile, indent=2, sort_keys=True)
+        os.rename(temporary, path)
@@ -0,0 +1,111 @@
+"""
+Printer bundles everything OctoPiPanel keeps per OctoPrint instance: the API
+session, state poller, command queue, optional push client, file listing,
+layer preview, webcam and temperature history. Every printer polls and sends commands
+on threads of its own, so a slow or unreachable printer never holds up the
+others or the main loop.
+"""
+
+import time
+from statepoller import StatePoller, MODE_DISCONNECTED
+from commandqueue import CommandQueue
+from ringbuffer import TempRingBuffer
+from tempzoom import MinMaxPyramid
+from filelist import FileList
+from gcodepreview import LayerPreview
+from webcam import Webcam
+
+WEBCAM_SNAPSHOT = '/webcam/?action=snapshot'
+
+
+class Printer(object):
+    """
+    @var name: shown on the overview screen
+    @var history: one temperature sample per graph column
+    @var zoom: min/max aggregates of all samples, for zoomed out graphs
+    @var historyFile: TempHistoryFile the samples are kept in, or None
+    @var printStartSample: zoom.total when the current print started
+    @var files: FileList of the printer's OctoPrint, fetched when first needed
+    @var preview: LayerPreview of the job's file, built when first shown
+    @var webcam: Webcam fetching snapshots while the Camera screen shows them
+    """
+
+    def __init__(self, name, api, pollintervals, historyLength, filecache=None, previewcache=None, webcamurl=None):
+        self.name = name
+        self.api = api
+
+        self.poller = StatePoller(api, pollintervals)
+        self.poller.setName("StatePoller " + name)
+        self.commands = CommandQueue(api)
+        self.commands.setName("CommandQueue " + name)
+        self.push = None
+        self.files = FileList(api, filecache)
+        self.files.setName("FileList " + name)
+        self.preview = LayerPreview(api, previewcache)
+        self.preview.setName("LayerPreview " + name)
+
+        # OctoPi serves the webcam next to OctoPrint
+        if webcamurl is None:
+            webcamurl = api.url(WEBCAM_SNAPSHOT)
+        self.webcam = Webcam(webcamurl, name="Webcam " + name)
+
+        self.history = TempRingBuffer(historyLength, 2)
+        self.zoom = MinMaxPyramid(2)
+        self.historyFile = None
+        self.printStartSample = None
+        self._busy = False
+
+    def setPush(self, push):
+        self.push = push
+        self.poller.push = push
+        push.files = self.files
+
+    def start(self):
+        self.poller.start()
+        self.commands.start()
+        self.files.start()
+        self.preview.start()
+        self.webcam.start()
+        if self.push is not None:
+            self.push.start()
+
+    def stop(self):
+        self.poller.stop()
+        self.commands.stop()
+        self.files.stop()
+        self.preview.stop()
+        self.webcam.stop()
+        if self.push is not None:
+            self.push.stop()
+        self.api.close()
+
+        if self.historyFile is not None:
+            self.historyFile.close()
+
+    def sample(self):
+        """Add the latest temperatures to the history, returns the snapshot used."""
+        state = self.poller.latest()
+
+        # Remember where the print started for the whole print graph
+        if state.Printing and not self._busy:
+            self.printStartSample = self.zoom.total
+        self._busy = state.Printing or state.Paused
+
+        self.history.append([state.HotEndTemp, state.BedTemp])
+        self.zoom.append([state.HotEndTemp, state.BedTemp])
+        if self.historyFile is not None:
+            self.historyFile.append(time.time(), state.HotEndTemp, state.HotEndTempTarget, state.BedTemp, state.BedTempTarget)
+        return state
+
+    def status(self):
+        """One line summary for the overview screen."""
+        state = self.poller.latest()
+        if self.poller.mode == MODE_DISCONNECTED:
+            text = "Offline"
+        elif state.Paused:
+            text = "Paused {0:.0f}%".format(state.Completion or 0)
+        elif state.Printing:
+            text = "Printing {0:.0f}%".format(state.Completion or 0)
+        else:
+            text = "Idle"
+        return u'{0}  {1:.0f}/{2:.0f}\N{DEGREE SIGN}C'.format(text, state.HotEndTemp or 0, state.BedTemp or 0)
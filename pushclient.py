@@ -0,0 +1,142 @@
+"""
+PushClient subscribes to OctoPrint's push socket (SockJS raw websocket at
+/sockjs/websocket) and feeds the "current" messages into a StatePoller as
+the same fields the REST poll sets. While the socket is connected the poller
+stops polling, when it drops the poller takes over again until the socket
+has been reconnected. File change events invalidate the panel's FileList.
+
+Requires the optional websocket-client module (pip install websocket-client).
+"""
+
+import json
+import threading
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+
+# Events that mean the file listing changed
+FILE_EVENTS = ('UpdatedFiles', 'FileAdded', 'FileRemoved', 'FolderAdded', 'FolderRemoved')
+
+
+def push_available():
+    return websocket is not None
+
+
+def parse_current(current):
+    """Translate a push "current" message into PrinterState fields."""
+    changes = {}
+
+    temps = current.get('temps') or []
+    if temps:
+        # Only the newest sample matters, the graph samples on its own clock
+        temp = temps[-1]
+        if temp.get('tool0'):
+            changes['HotEndTemp'] = temp['tool0']['actual']
+            changes['HotEndTempTarget'] = temp['tool0']['target'] or 0.0
+            changes['HotHotEnd'] = changes['HotEndTempTarget'] > 0.0
+        if temp.get('bed'):
+            changes['BedTemp'] = temp['bed']['actual'] or 0.0
+            changes['BedTempTarget'] = temp['bed']['target'] or 0.0
+
+    progress = current.get('progress')
+    if progress:
+        changes['Completion'] = progress.get('completion')
+        changes['PrintTimeLeft'] = progress.get('printTimeLeft')
+        changes['FilePos'] = progress.get('filepos')
+
+    state = current.get('state')
+    job = current.get('job')
+    if state and job:
+        fileName = job['file']['name']
+        changes['FileName'] = fileName
+        changes['FileOrigin'] = job['file'].get('origin')
+        changes['FilePath'] = job['file'].get('path') or fileName
+        changes['JobLoaded'] = state['text'] == "Operational" and (fileName != "") or (fileName != None)
+        changes['Paused'] = state['text'] == "Paused"
+        changes['Printing'] = state['text'] == "Printing"
+
+    return changes
+
+
+class PushClient(threading.Thread):
+    """
+    @var connected: True while state is arriving over the push socket
+    @var pushurl: websocket url, derived from the OctoPrint base url by default
+    """
+
+    def __init__(self, api, poller, pushurl=None, timeout=10.0, reconnectdelay=5.0):
+        threading.Thread.__init__(self, name="PushClient")
+        self.daemon = True
+
+        self.api = api
+        self.poller = poller
+        self.timeout = timeout
+        self.reconnectdelay = reconnectdelay
+
+        if pushurl is None:
+            pushurl = api.baseurl.replace('http://', 'ws://', 1).replace('https://', 'wss://', 1) + '/sockjs/websocket'
+        self.pushurl = pushurl
+
+        self.connected = False
+        self._socket = None
+
+        # Optional FileList, invalidated when files change on the server
+        self.files = None
+        self._stopEvent = threading.Event()
+
+    def run(self):
+        while not self._stopEvent.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                if not self._stopEvent.is_set():
+                    print "Push connection lost, falling back to polling: {0}".format(e)
+
+            # Pushed state may be stale by now, have the poller take over right away
+            if self.connected:
+                self.connected = False
+                self.poller.refresh()
+            self._socket = None
+            self._stopEvent.wait(self.reconnectdelay)
+
+    def stop(self):
+        self._stopEvent.set()
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except Exception:
+                pass
+
+    def _listen(self):
+        # recv() raising a timeout means OctoPrint went quiet, treat it as a drop
+        self._socket = websocket.create_connection(self.pushurl, timeout=self.timeout)
+        self._authenticate()
+
+        while not self._stopEvent.is_set():
+            message = self._socket.recv()
+            if not message:
+                break
+
+            self._handle(json.loads(message))
+
+    def _authenticate(self):
+        # OctoPrint >= 1.3.10 only pushes state to authenticated sockets
+        req = self.api.post('/api/login', { "passive": True })
+        if req.status_code == 200:
+            user = json.loads(req.text)
+            if 'name' in user and 'session' in user:
+                self._socket.send(json.dumps({ "auth": "{0}:{1}".format(user['name'], user['session']) }))
+
+    def _handle(self, message):
+        if 'current' in message:
+            current = message['current']
+            connection = (current.get('state') or {}).get('text')
+            self.poller.pushed(parse_current(current), connection)
+            self.connected = True
+
+        event = message.get('event')
+        if event and event.get('type') in FILE_EVENTS and self.files is not None:
+            self.files.invalidate()
@@ -38,8 +38,15 @@ or implied, of Al Sweigart.
 import pygame
 from pygame.locals import *
 
-pygame.font.init()
-PYGBUTTON_FONT = pygame.font.Font('freesansbold.ttf', 14)
+# Default font, loaded the first time a button without a font is created
+PYGBUTTON_FONT = None
+
+def _defaultFont():
+    global PYGBUTTON_FONT
+    if PYGBUTTON_FONT is None:
+        pygame.font.init()
+        PYGBUTTON_FONT = pygame.font.Font('freesansbold.ttf', 14)
+    return PYGBUTTON_FONT
 
 BLACK     = (  0,   0,   0)
 WHITE     = (255, 255, 255)
@@ -47,6 +54,11 @@ DARKGRAY  = ( 64,  64,  64)
 GRAY      = (128, 128, 128)
 LIGHTGRAY = (212, 208, 200)
 
+# Rendered (normal, down, highlight) faces of text buttons, shared by all
+# buttons and keyed by (caption, bgcolor, fgcolor, font, size)
+FACE_CACHE_SIZE = 64
+_faceCache = {}
+
 class PygButton(object):
     def __init__(self, rect=None, caption='', bgcolor=LIGHTGRAY, fgcolor=BLACK, font=None, normal=None, down=None, highlight=None):
         """Create a new button object. Parameters:
@@ -85,7 +97,7 @@ class PygButton(object):
         self._fgcolor = fgcolor
 
         if font is None:
-            self._font = PYGBUTTON_FONT
+            self._font = _defaultFont()
         else:
             self._font = font
 
@@ -95,12 +107,10 @@ class PygButton(object):
         self.lastMouseDownOverButton = False # was the last mouse down event over the mouse button? (Used to track clicks.)
         self._visible = True # is the button visible
         self.customSurfaces = False # button starts as a text button instead of having custom images for each surface
+        self.dirty = True # does the button need to be redrawn on screen?
 
         if normal is None:
             # create the surfaces for a text button
-            self.surfaceNormal = pygame.Surface(self._rect.size)
-            self.surfaceDown = pygame.Surface(self._rect.size)
-            self.surfaceHighlight = pygame.Surface(self._rect.size)
             self._update() # draw the initial button images
         else:
             # create the surfaces for a custom image button
@@ -129,6 +139,8 @@ class PygButton(object):
             return []
 
         retVal = []
+        wasDown = self.buttonDown
+        wasOver = self.mouseOverButton
 
         hasExited = False
         if not self.mouseOverButton and self._rect.collidepoint(eventObj.pos):
@@ -177,6 +189,9 @@ class PygButton(object):
             self.mouseExit(eventObj)
             retVal.append('exit')
 
+        if wasDown != self.buttonDown or wasOver != self.mouseOverButton:
+            self.dirty = True
+
         return retVal
 
     def draw(self, surfaceObj):
@@ -192,47 +207,63 @@ class PygButton(object):
 
     def _update(self):
         """Redraw the button's Surface object. Call this method when the button has changed appearance."""
+        self.dirty = True
         if self.customSurfaces:
             self.surfaceNormal    = pygame.transform.smoothscale(self.origSurfaceNormal, self._rect.size)
             self.surfaceDown      = pygame.transform.smoothscale(self.origSurfaceDown, self._rect.size)
             self.surfaceHighlight = pygame.transform.smoothscale(self.origSurfaceHighlight, self._rect.size)
             return
 
+        key = (self._caption, tuple(self.bgcolor), tuple(self.fgcolor), self._font, self._rect.size)
+        faces = _faceCache.get(key)
+        if faces is None:
+            faces = self._renderFaces()
+            if len(_faceCache) >= FACE_CACHE_SIZE:
+                _faceCache.clear()
+            _faceCache[key] = faces
+
+        self.surfaceNormal, self.surfaceDown, self.surfaceHighlight = faces
+
+
+    def _renderFaces(self):
+        """Render new normal, down and highlight surfaces for a text button."""
         w = self._rect.width # syntactic sugar
         h = self._rect.height # syntactic sugar
 
+        surfaceNormal = pygame.Surface(self._rect.size)
+        surfaceDown = pygame.Surface(self._rect.size)
+
         # fill background color for all buttons
-        self.surfaceNormal.fill(self.bgcolor)
-        self.surfaceDown.fill(self.bgcolor)
-        self.surfaceHighlight.fill(self.bgcolor)
+        surfaceNormal.fill(self.bgcolor)
+        surfaceDown.fill(self.bgcolor)
 
         # draw caption text for all buttons
         captionSurf = self._font.render(self._caption, True, self.fgcolor, self.bgcolor)
         captionRect = captionSurf.get_rect()
         captionRect.center = int(w / 2), int(h / 2)
-        self.surfaceNormal.blit(captionSurf, captionRect)
-        self.surfaceDown.blit(captionSurf, captionRect)
+        surfaceNormal.blit(captionSurf, captionRect)
+        surfaceDown.blit(captionSurf, captionRect)
 
         # draw border for normal button
-        pygame.draw.rect(self.surfaceNormal, BLACK, pygame.Rect((0, 0, w, h)), 1) # black border around everything
-        pygame.draw.line(self.surfaceNormal, WHITE, (1, 1), (w - 2, 1))
-        pygame.draw.line(self.surfaceNormal, WHITE, (1, 1), (1, h - 2))
-        pygame.draw.line(self.surfaceNormal, DARKGRAY, (1, h - 1), (w - 1, h - 1))
-        pygame.draw.line(self.surfaceNormal, DARKGRAY, (w - 1, 1), (w - 1, h - 1))
-        pygame.draw.line(self.surfaceNormal, GRAY, (2, h - 2), (w - 2, h - 2))
-        pygame.draw.line(self.surfaceNormal, GRAY, (w - 2, 2), (w - 2, h - 2))
+        pygame.draw.rect(surfaceNormal, BLACK, pygame.Rect((0, 0, w, h)), 1) # black border around everything
+        pygame.draw.line(surfaceNormal, WHITE, (1, 1), (w - 2, 1))
+        pygame.draw.line(surfaceNormal, WHITE, (1, 1), (1, h - 2))
+        pygame.draw.line(surfaceNormal, DARKGRAY, (1, h - 1), (w - 1, h - 1))
+        pygame.draw.line(surfaceNormal, DARKGRAY, (w - 1, 1), (w - 1, h - 1))
+        pygame.draw.line(surfaceNormal, GRAY, (2, h - 2), (w - 2, h - 2))
+        pygame.draw.line(surfaceNormal, GRAY, (w - 2, 2), (w - 2, h - 2))
 
         # draw border for down button
-        pygame.draw.rect(self.surfaceDown, BLACK, pygame.Rect((0, 0, w, h)), 1) # black border around everything
-        pygame.draw.line(self.surfaceDown, WHITE, (1, 1), (w - 2, 1))
-        pygame.draw.line(self.surfaceDown, WHITE, (1, 1), (1, h - 2))
-        pygame.draw.line(self.surfaceDown, DARKGRAY, (1, h - 2), (1, 1))
-        pygame.draw.line(self.surfaceDown, DARKGRAY, (1, 1), (w - 2, 1))
-        pygame.draw.line(self.surfaceDown, GRAY, (2, h - 3), (2, 2))
-        pygame.draw.line(self.surfaceDown, GRAY, (2, 2), (w - 3, 2))
+        pygame.draw.rect(surfaceDown, BLACK, pygame.Rect((0, 0, w, h)), 1) # black border around everything
+        pygame.draw.line(surfaceDown, WHITE, (1, 1), (w - 2, 1))
+        pygame.draw.line(surfaceDown, WHITE, (1, 1), (1, h - 2))
+        pygame.draw.line(surfaceDown, DARKGRAY, (1, h - 2), (1, 1))
+        pygame.draw.line(surfaceDown, DARKGRAY, (1, 1), (w - 2, 1))
+        pygame.draw.line(surfaceDown, GRAY, (2, h - 3), (2, 2))
+        pygame.draw.line(surfaceDown, GRAY, (2, 2), (w - 3, 2))
 
-        # draw border for highlight button
-        self.surfaceHighlight = self.surfaceNormal
+        # highlight button looks like the normal button
+        return surfaceNormal, surfaceDown, surfaceNormal
 
 
     def mouseClick(self, event):
@@ -273,6 +304,7 @@ class PygButton(object):
         self.surfaceDown = self.origSurfaceDown
         self.surfaceHighlight = self.origSurfaceHighlight
         self.customSurfaces = True
+        self.dirty = True
         self._rect = pygame.Rect((self._rect.left, self._rect.top, self.surfaceNormal.get_width(), self.surfaceNormal.get_height()))
 
 
@@ -282,6 +314,8 @@ class PygButton(object):
 
 
     def _propSetCaption(self, captionText):
+        if captionText == self._caption and not self.customSurfaces:
+            return # nothing changed
         self.customSurfaces = False
         self._caption = captionText
         self._update()
@@ -302,6 +336,8 @@ class PygButton(object):
 
 
     def _propSetVisible(self, setting):
+        if setting != self._visible:
+            self.dirty = True
         self._visible = setting
 
 
@@ -310,6 +346,8 @@ class PygButton(object):
 
 
     def _propSetFgColor(self, setting):
+        if setting == self._fgcolor and not self.customSurfaces:
+            return # nothing changed
         self.customSurfaces = False
         self._fgcolor = setting
         self._update()
@@ -320,6 +358,8 @@ class PygButton(object):
 
 
     def _propSetBgColor(self, setting):
+        if setting == self._bgcolor and not self.customSurfaces:
+            return # nothing changed
         self.customSurfaces = False
         self._bgcolor = setting
         self._update()
@@ -330,6 +370,8 @@ class PygButton(object):
 
 
     def _propSetFont(self, setting):
+        if setting == self._font and not self.customSurfaces:
+            return # nothing changed
         self.customSurfaces = False
         self._font = setting
         self._update()
@@ -0,0 +1,77 @@
+"""
+TempRingBuffer is a compact fixed size ring buffer holding several
+temperature series side by side (e.g. hot end and bed). Samples are stored
+as 32 bit floats, in a NumPy array when NumPy is installed and in one
+array.array per series otherwise.
+
+lines() turns a whole series into screen coordinates in one vectorized step
+so it can be handed straight to pygame.draw.lines(). NaN samples mark gaps
+in the history, the series is split into one polyline per run between them.
+"""
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TempRingBuffer(object):
+    """
+    @var length: number of samples kept per series
+    @var head: index of the oldest sample, where the next one is written
+    """
+
+    def __init__(self, length, series=2):
+        self.length = length
+        self.count = series
+        self.head = 0
+
+        if numpy is not None:
+            self.data = numpy.zeros((series, length), dtype=numpy.float32)
+        else:
+            self.data = [array('f', [0.0] * length) for i in range(series)]
+
+    def append(self, values):
+        """Overwrite the oldest sample of every series with values."""
+        for i, value in enumerate(values):
+            self.data[i][self.head] = value or 0.0
+        self.head = (self.head + 1) % self.length
+
+    def latest(self, index):
+        return self.data[index][self.head - 1]
+
+    def series(self, index):
+        """All samples of one series, oldest first."""
+        data = self.data[index]
+        if numpy is not None:
+            return numpy.concatenate((data[self.head:], data[:self.head]))
+        return data[self.head:] + data[:self.head]
+
+    def lines(self, index, left, bottom, scale):
+        """Screen coordinates of one series, one sample per pixel column, a list of points per run without gaps."""
+        samples = self.series(index)
+        if numpy is not None:
+            gaps = numpy.isnan(samples)
+            points = numpy.empty((self.length, 2), dtype=numpy.int32)
+            points[:, 0] = numpy.arange(left, left + self.length)
+            points[:, 1] = bottom - (numpy.where(gaps, 0.0, samples) * scale).astype(numpy.int32)
+            if not gaps.any():
+                return [points.tolist()]
+            return _runs(points.tolist(), gaps.tolist())
+
+        # NaN is the only value not equal to itself
+        gaps = [t != t for t in samples]
+        return _runs([(left + x, bottom - int(t * scale)) if t == t else None for x, t in enumerate(samples)], gaps)
+
+
+def _runs(points, gaps):
+    """Split points into lists of consecutive points, leaving out the gaps."""
+    runs = [[]]
+    for point, gap in zip(points, gaps):
+        if not gap:
+            runs[-1].append(point)
+        elif runs[-1]:
+            runs.append([])
+    return [run for run in runs if run]
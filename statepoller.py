@@ -0,0 +1,275 @@
+"""
+StatePoller fetches printer, job and connection status from OctoPrint on a
+background thread and publishes it as immutable, timestamped PrinterState
+snapshots. The main loop only ever reads the latest snapshot, so it never
+waits on the network.
+"""
+
+import json
+import time
+import threading
+import requests
+from collections import namedtuple
+
+# Immutable snapshot of everything the panel shows about the printer
+PrinterState = namedtuple('PrinterState', [
+    'sequence',         # increases by one for every published snapshot
+    'timestamp',        # time.time() when the snapshot was taken
+    'HotEndTemp',
+    'HotEndTempTarget',
+    'BedTemp',
+    'BedTempTarget',
+    'HotHotEnd',
+    'Paused',
+    'Printing',
+    'JobLoaded',
+    'Completion',       # In procent
+    'PrintTimeLeft',
+    'FileName',
+    'FileOrigin',       # "local" or "sdcard"
+    'FilePath',         # path of the job's file within its origin
+    'FilePos',          # bytes of the job's file sent to the printer so far
+])
+
+EMPTY_STATE = PrinterState(
+    sequence = 0,
+    timestamp = 0.0,
+    HotEndTemp = 0.0,
+    HotEndTempTarget = 0.0,
+    BedTemp = 0.0,
+    BedTempTarget = 0.0,
+    HotHotEnd = False,
+    Paused = False,
+    Printing = False,
+    JobLoaded = False,
+    Completion = 0,
+    PrintTimeLeft = 0,
+    FileName = "Nothing",
+    FileOrigin = None,
+    FilePath = None,
+    FilePos = None,
+)
+
+
+# Endpoints polled by the StatePoller
+ENDPOINTS = ('printer', 'job', 'connection')
+
+# Printer modes, every endpoint has a poll interval for each of them
+MODE_ACTIVE = 'active'              # heating, printing or paused
+MODE_IDLE = 'idle'                  # connected, nothing going on
+MODE_DISCONNECTED = 'disconnected'  # no printer or no OctoPrint
+MODES = (MODE_ACTIVE, MODE_IDLE, MODE_DISCONNECTED)
+
+# Intervals are this many times longer while the display is off
+POWERSAVE_FACTOR = 5
+
+# Connection states meaning there is no printer to talk to
+_OFFLINE_STATES = ('Closed', 'Offline', 'Error')
+
+
+def default_intervals(updatetime):
+    """Poll intervals in ms per endpoint and mode, derived from updatetime."""
+    return {
+        'printer':    { MODE_ACTIVE: updatetime,     MODE_IDLE: updatetime * 5 / 2, MODE_DISCONNECTED: updatetime * 5 },
+        'job':        { MODE_ACTIVE: updatetime,     MODE_IDLE: updatetime * 5,     MODE_DISCONNECTED: updatetime * 15 },
+        'connection': { MODE_ACTIVE: updatetime * 5 / 2, MODE_IDLE: updatetime * 5 / 2, MODE_DISCONNECTED: updatetime * 5 / 2 },
+    }
+
+
+class StatePoller(threading.Thread):
+    """
+    Polls every endpoint on its own schedule. Intervals adapt to what the
+    printer is doing: short while heating or printing, long while idle or
+    disconnected.
+
+    @var api: OctoPrintSession used for all requests
+    @var intervals: endpoint -> mode -> ms between two polls
+    @var mode: current printer mode, one of MODES
+    @var powersave: True while nobody is looking, polls much less often
+    """
+
+    def __init__(self, api, intervals):
+        threading.Thread.__init__(self, name="StatePoller")
+        self.daemon = True
+
+        self.api = api
+        self.intervals = intervals
+        self.mode = MODE_DISCONNECTED
+        self.powersave = False
+
+        self._lock = threading.Lock()
+        self._latest = EMPTY_STATE
+        self._wakeEvent = threading.Event()
+        self._stopped = False
+
+        # When each endpoint was last polled, and the raw job and connection state
+        self._polled = dict((endpoint, 0.0) for endpoint in ENDPOINTS)
+        self._job = None
+        self._connection = None
+        self._reachable = False
+
+        # Optional PushClient, polling is paused while it is connected
+        self.push = None
+
+        # Optional callable, called after every published snapshot
+        self.listener = None
+
+    def run(self):
+        while not self._stopped:
+            # While the push socket is delivering state there is no need to poll
+            if self.push is None or not self.push.connected:
+                changes = {}
+                for endpoint in ENDPOINTS:
+                    if time.time() >= self._due(endpoint):
+                        changes.update(self.poll(endpoint))
+                        self._polled[endpoint] = time.time()
+
+                if changes:
+                    self.update(changes)
+                self.mode = self._mode()
+
+            if self.push is not None and self.push.connected:
+                # Nothing to poll, the push client wakes us up when its socket drops
+                self._wakeEvent.wait()
+            else:
+                wait = min(self._due(endpoint) for endpoint in ENDPOINTS) - time.time()
+                self._wakeEvent.wait(max(wait, 0.05))
+            self._wakeEvent.clear()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeEvent.set()
+
+    def refresh(self):
+        """Poll every endpoint right away, e.g. after a command was sent."""
+        for endpoint in ENDPOINTS:
+            self._polled[endpoint] = 0.0
+        self._wakeEvent.set()
+
+    def _due(self, endpoint):
+        interval = self.intervals[endpoint][self.mode] / 1000.0
+        if self.powersave:
+            interval *= POWERSAVE_FACTOR
+        return self._polled[endpoint] + interval
+
+    def _mode(self):
+        state = self.latest()
+        if not self._reachable or self._connection is None or self._connection.startswith(_OFFLINE_STATES):
+            return MODE_DISCONNECTED
+        if state.Printing or state.Paused or state.HotEndTempTarget > 0.0 or state.BedTempTarget > 0.0:
+            return MODE_ACTIVE
+        return MODE_IDLE
+
+    def latest(self):
+        """Return the most recently published PrinterState."""
+        with self._lock:
+            return self._latest
+
+    def update(self, changes):
+        """Publish a new snapshot with the given fields changed."""
+        with self._lock:
+            values = self._latest._asdict()
+            values.update(changes)
+            values['sequence'] = self._latest.sequence + 1
+            values['timestamp'] = time.time()
+            self._latest = PrinterState(**values)
+
+        if self.listener is not None:
+            self.listener()
+
+    def pushed(self, changes, connection):
+        """
+        Publish state that arrived over the push socket. connection is the
+        connection state pushed with it, e.g. "Printing", or None.
+        """
+        self._reachable = True
+        if connection is not None:
+            self._connection = connection
+        if changes:
+            self.update(changes)
+        self.mode = self._mode()
+
+    """
+    Get status update for one endpoint from API, regarding temp etc.
+    Returns a dict of changed PrinterState fields, empty if nothing could
+    be fetched. Never raises, a bad answer must not end the poller thread.
+    """
+    def poll(self, endpoint):
+        try:
+            req = self.api.get('/api/' + endpoint)
+            if req.status_code == 401:
+                print "Error: {0}".format(req.text)
+                changes = {}
+            elif req.status_code != 200:
+                # e.g. 409 when the printer isn't connected
+                changes = {}
+            else:
+                changes = self._changes(endpoint, json.loads(req.text))
+        except requests.exceptions.RequestException as e:
+            print "Polling /api/{0} failed: {1}".format(endpoint, e)
+            self._reachable = False
+            return {}
+        except (ValueError, KeyError, TypeError) as e:
+            # Truncated body or fields missing, try again on the next poll
+            print "Bad answer from /api/{0}: {1!r}".format(endpoint, e)
+            self._reachable = False
+            return {}
+
+        self._reachable = True
+        return changes
+
+    def _changes(self, endpoint, state):
+        if endpoint == 'printer':
+            return self._printer_changes(state)
+
+        # Only keep the new job or connection state once it could be used
+        if endpoint == 'job':
+            job, connection = state, self._connection
+        else:
+            job, connection = self._job, state['current']['state']
+        changes = self._job_changes(job, connection)
+        self._job = job
+        self._connection = connection
+        return changes
+
+    def _printer_changes(self, state):
+        values = {}
+
+        # Set status flags
+        tempKey = 'temps' if 'temps' in state else 'temperature'
+        values['HotEndTemp'] = state[tempKey]['tool0']['actual']
+        values['HotEndTempTarget'] = state[tempKey]['tool0']['target']
+        if 'bed' in state[tempKey]:
+            values['BedTemp'] = state[tempKey]['bed']['actual']
+            values['BedTempTarget'] = state[tempKey]['bed']['target']
+
+        if values['HotEndTempTarget'] is None:
+            values['HotEndTempTarget'] = 0.0
+
+        if values.get('BedTempTarget', 0.0) is None:
+            values['BedTempTarget'] = 0.0
+
+        if values.get('BedTemp', 0.0) is None:
+            values['BedTemp'] = 0.0
+
+        values['HotHotEnd'] = values['HotEndTempTarget'] > 0.0
+        return values
+
+    def _job_changes(self, jobState, connState):
+        # Job fields need both the job and the connection state
+        if jobState is None or connState is None:
+            return {}
+
+        values = {}
+
+        values['Completion'] = jobState['progress']['completion'] # In procent
+        values['PrintTimeLeft'] = jobState['progress']['printTimeLeft']
+        values['FileName'] = jobState['job']['file']['name']
+        values['FileOrigin'] = jobState['job']['file'].get('origin')
+        values['FilePath'] = jobState['job']['file'].get('path') or jobState['job']['file']['name']
+        values['FilePos'] = jobState['progress'].get('filepos')
+        values['JobLoaded'] = connState == "Operational" and (jobState['job']['file']['name'] != "") or (jobState['job']['file']['name'] != None)
+
+        values['Paused'] = connState == "Paused"
+        values['Printing'] = connState == "Printing"
+        return values
@@ -0,0 +1,102 @@
+"""
+TempGraph keeps the temperature curves on a persistent, color keyed surface.
+Every new sample scrolls the surface one column to the left and only the
+newest column is drawn, so the cost of a sample doesn't depend on the graph
+width. Target temperature lines live on a separate overlay that is only
+redrawn when a target changes. The graph area, grid and axes are part of the
+static background, drawing the graph on top of it is two blits.
+"""
+
+import pygame
+
+OVERLAY_KEY = (255, 0, 255)
+
+
+class TempGraph(object):
+    """
+    @var surface: color keyed scrolling surface with the temperature curves
+    @var overlay: color keyed surface with the target temperature lines
+    """
+
+    def __init__(self, size, colors, targetcolors, maxtemp=250.0):
+        self.width, self.height = size
+        self.colors = colors
+        self.targetcolors = targetcolors
+        self.scale = self.height / maxtemp
+
+        self.surface = pygame.Surface(size)
+        self.surface.set_colorkey(OVERLAY_KEY)
+        self.overlay = pygame.Surface(size)
+        self.overlay.set_colorkey(OVERLAY_KEY)
+        self.targets = None
+        self.last = [0.0] * len(colors)
+
+        self.clear()
+        self.setTargets([0.0] * len(colors))
+
+    def _y(self, temp):
+        return self.height - int(temp * self.scale)
+
+    def clear(self):
+        self.surface.fill(OVERLAY_KEY)
+
+    def rebuild(self, history):
+        """Redraw the whole surface from a TempRingBuffer, one polyline per series and run between gaps."""
+        self.clear()
+        for i, color in enumerate(self.colors):
+            for points in history.lines(i, self.width - history.length, self.height, self.scale):
+                if len(points) > 1:
+                    pygame.draw.lines(self.surface, color, False, points, 2)
+                else:
+                    pygame.draw.line(self.surface, color, points[0], points[0], 2)
+        self.last = [history.latest(i) for i in range(len(self.colors))]
+
+    def drawEnvelope(self, columns):
+        """
+        Redraw the surface from (min, max) columns per series, as drawn for
+        zoomed out views. The max and min of every series are one polyline
+        each, right aligned, broken where a column holds no samples (min
+        above max).
+        """
+        self.clear()
+        for color, series in zip(self.colors, columns):
+            left = self.width - len(series)
+            run = []
+            for x, (low, high) in enumerate(series + [(1.0, 0.0)]):
+                if low <= high:
+                    run.append((left + x, low, high))
+                    continue
+                if len(run) > 1:
+                    pygame.draw.lines(self.surface, color, False, [(column[0], self._y(column[2])) for column in run], 2)
+                    pygame.draw.lines(self.surface, color, False, [(column[0], self._y(column[1])) for column in run], 1)
+                run = []
+
+    def push(self, temps):
+        """Scroll one column to the left and draw the newest samples."""
+        w = self.width
+
+        self.surface.scroll(-1, 0)
+        self.surface.fill(OVERLAY_KEY, (w - 1, 0, 1, self.height))
+
+        # Continue the polylines from the previous samples, unless either is a gap (NaN)
+        for color, last, t in zip(self.colors, self.last, temps):
+            if last == last and t == t:
+                pygame.draw.line(self.surface, color, [w - 2, self._y(last)], [w - 1, self._y(t)], 2)
+        self.last = [t or 0.0 for t in temps]
+
+    def setTargets(self, targets):
+        """Redraw the target lines, does nothing if the targets didn't change."""
+        targets = list(targets)
+        if targets == self.targets:
+            return False
+
+        self.targets = targets
+        self.overlay.fill(OVERLAY_KEY)
+        for color, t in zip(self.targetcolors, targets):
+            y = self.height - t * self.scale
+            pygame.draw.line(self.overlay, color, [0, y], [self.width, y], 1)
+        return True
+
+    def draw(self, surfaceObj, position):
+        surfaceObj.blit(self.surface, position)
+        surfaceObj.blit(self.overlay, position)
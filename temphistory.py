@@ -0,0 +1,127 @@
+"""
+TempHistoryFile is a persistent ring buffer of timestamped temperature
+samples (hot end and bed, actual and target) in a memory-mapped file of
+fixed size records. Appending a sample writes one record and the header in
+place, so the file is never rewritten and memory use doesn't depend on how
+much history is kept. Samples survive restarts and crashes of the panel.
+
+Every record keeps its timestamp. withGaps() turns records back into evenly
+spaced series for the graphs, filling time nothing was recorded in, e.g.
+while the panel was off, with GAP samples the graphs break their lines at.
+"""
+
+import os
+import mmap
+import struct
+
+MAGIC = 'OPPH'
+VERSION = 1
+
+# magic, version, capacity, index of the next record to write, number of records
+HEADER = struct.Struct('<4sIIII')
+
+# timestamp, hot end, hot end target, bed, bed target
+RECORD = struct.Struct('<dffff')
+
+# Sample standing for time nothing was recorded in, NaN never equals itself
+GAP = float('nan')
+
+# Records further apart than this many sample intervals have a gap between them
+GAP_INTERVALS = 3
+
+
+def _missing(seconds, interval, limit):
+    """Number of GAP samples standing for seconds without records."""
+    if seconds <= GAP_INTERVALS * interval:
+        return 0
+    missing = int(round(seconds / interval)) - 1
+    if limit is not None:
+        missing = min(missing, limit)
+    return missing
+
+
+def withGaps(records, interval, now=None, limit=None):
+    """
+    Hot end and bed series, one sample per interval seconds, oldest first.
+    Gaps between records, and between the newest one and now if given, are
+    filled with as many GAP samples as would have been recorded meanwhile.
+    Only the newest limit samples of each series are returned.
+    """
+    hotend = []
+    bed = []
+    previous = None
+    for record in records:
+        if previous is not None:
+            missing = _missing(record[0] - previous, interval, limit)
+            hotend.extend([GAP] * missing)
+            bed.extend([GAP] * missing)
+        hotend.append(record[1])
+        bed.append(record[3])
+        previous = record[0]
+
+    if now is not None and previous is not None:
+        missing = _missing(now - previous, interval, limit)
+        hotend.extend([GAP] * missing)
+        bed.extend([GAP] * missing)
+
+    if limit is not None:
+        return hotend[-limit:], bed[-limit:]
+    return hotend, bed
+
+
+class TempHistoryFile(object):
+    """
+    @var capacity: number of samples kept, the oldest one is overwritten first
+    """
+
+    def __init__(self, path, capacity=21600):
+        self.path = path
+        self.capacity = capacity
+        size = HEADER.size + capacity * RECORD.size
+
+        # Start over if the file is missing, from another version or has another size
+        if not self._valid(path, size):
+            with open(path, 'wb') as historyFile:
+                historyFile.write(HEADER.pack(MAGIC, VERSION, capacity, 0, 0))
+                historyFile.truncate(size)
+
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), size)
+        magic, version, capacity, self.head, self.count = HEADER.unpack_from(self._map, 0)
+
+    def _valid(self, path, size):
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            return False
+
+        with open(path, 'rb') as historyFile:
+            magic, version, capacity, head, count = HEADER.unpack(historyFile.read(HEADER.size))
+        return magic == MAGIC and version == VERSION and capacity == self.capacity and head < capacity and count <= capacity
+
+    def __len__(self):
+        return self.count
+
+    def append(self, timestamp, hotend, hotendTarget, bed, bedTarget):
+        RECORD.pack_into(self._map, HEADER.size + self.head * RECORD.size,
+                         timestamp, hotend or 0.0, hotendTarget or 0.0, bed or 0.0, bedTarget or 0.0)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, self.capacity, self.head, self.count)
+
+    def last(self, n):
+        """The newest n records, oldest first. Unpacked a contiguous run of records at a time."""
+        n = min(n, self.count)
+        position = (self.head - n) % self.capacity
+        records = []
+        while n > 0:
+            run = min(n, self.capacity - position)
+            values = struct.unpack_from('<' + RECORD.format[1:] * run, self._map, HEADER.size + position * RECORD.size)
+            fields = len(values) // run
+            records.extend(values[i:i + fields] for i in range(0, len(values), fields))
+            n -= run
+            position = 0
+        return records
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
@@ -0,0 +1,154 @@
+"""
+MinMaxPyramid keeps multi-resolution min/max aggregates of temperature
+series for zoomed out graphs. Level 0 holds single samples, every level above
+holds buckets of `factor` buckets of the level below. Aggregates are updated
+as samples arrive, so showing an hour or a whole print only reads the few
+hundred buckets of the matching level instead of rescanning the history.
+Keeping the minimum and maximum of every bucket keeps spikes visible after
+downsampling. load() builds all levels from a whole history at once, for
+restoring it at startup without appending sample by sample.
+
+NaN samples are gaps in the history. They count as a sample but hold no
+value, a bucket of nothing but gaps is (inf, -inf), its min above its max.
+"""
+
+from collections import deque
+
+INF = float('inf')
+
+
+def _bucket(value):
+    # NaN is the only value not equal to itself
+    if value != value:
+        return (INF, -INF)
+    return (value, value)
+
+
+class MinMaxPyramid(object):
+    """
+    @var total: number of samples appended so far
+    """
+
+    def __init__(self, series=2, factor=6, levels=4, capacity=2048):
+        self.series = series
+        self.factor = factor
+        self.capacity = capacity
+        self.total = 0
+
+        # Completed (min, max) buckets per level and series
+        self._buckets = [[deque(maxlen=capacity) for s in range(series)] for level in range(levels)]
+
+        # Bucket being filled per level, with how many lower buckets it holds
+        self._partial = [[None] * series for level in range(levels)]
+        self._partialCount = [0] * levels
+
+    def append(self, values):
+        self.total += 1
+        carry = [_bucket(v or 0.0) for v in values]
+
+        for level in range(len(self._buckets)):
+            for s in range(self.series):
+                self._buckets[level][s].append(carry[s])
+
+            # Merge the new bucket into the one being built on the next level
+            upper = level + 1
+            if upper == len(self._buckets):
+                break
+
+            partial = self._partial[upper]
+            for s in range(self.series):
+                if partial[s] is None:
+                    partial[s] = carry[s]
+                else:
+                    partial[s] = (min(partial[s][0], carry[s][0]), max(partial[s][1], carry[s][1]))
+            self._partialCount[upper] += 1
+
+            if self._partialCount[upper] < self.factor:
+                break
+
+            # The next level's bucket is complete, carry it up
+            carry = partial
+            self._partial[upper] = [None] * self.series
+            self._partialCount[upper] = 0
+
+    def load(self, values):
+        """
+        Replace everything with the samples in values, one list per series,
+        oldest first. Every bucket is one min() and max() over a slice of
+        samples, and only the buckets a level keeps are built.
+        """
+        # Gaps become +inf in lows and -inf in highs, min() and max() skip them without a test per sample
+        lows = [[v or 0.0 if v == v else INF for v in series] for series in values]
+        highs = [[v or 0.0 if v == v else -INF for v in series] for series in values]
+        self.total = len(values[0]) if values else 0
+        for level in range(len(self._buckets)):
+            size = self.factor ** level
+            complete = self.total // size
+            first = max(0, complete - self.capacity)
+            for s in range(self.series):
+                low = lows[s]
+                high = highs[s]
+                buckets = self._buckets[level][s]
+                buckets.clear()
+                for start in range(first * size, complete * size, size):
+                    buckets.append((min(low[start:start + size]), max(high[start:start + size])))
+
+                # Complete buckets of the level below that don't fill one of this level yet
+                if level > 0:
+                    lower = size // self.factor
+                    end = (self.total // lower) * lower
+                    if end > complete * size:
+                        self._partial[level][s] = (min(low[complete * size:end]), max(high[complete * size:end]))
+                    else:
+                        self._partial[level][s] = None
+            if level > 0:
+                self._partialCount[level] = (self.total % size) // (size // self.factor)
+
+    def _openBucket(self, level, series):
+        """(min, max) of the samples not in a complete bucket of level yet, or None."""
+        bucket = None
+        for lower in range(level, 0, -1):
+            partial = self._partial[lower][series]
+            if partial is not None:
+                bucket = partial if bucket is None else (min(bucket[0], partial[0]), max(bucket[1], partial[1]))
+        return bucket
+
+    def _level(self, samples, columns):
+        """Coarsest level with at least one bucket per column that still covers samples."""
+        perColumn = max(1.0, float(samples) / columns)
+        level = 0
+        while (level + 1 < len(self._buckets) and self.factor ** (level + 1) <= perColumn) \
+                or (level + 1 < len(self._buckets) and self.capacity * self.factor ** level < samples):
+            level += 1
+        return level
+
+    def columns(self, series, samples, columns):
+        """
+        (min, max) per screen column for the newest samples of one series,
+        oldest first. Returns fewer than columns entries if there isn't
+        enough history yet.
+        """
+        samples = min(samples, self.total)
+        if samples <= 0:
+            return []
+
+        level = self._level(samples, columns)
+        size = self.factor ** level
+
+        # The newest bucket is still being filled, it holds the newest samples
+        buckets = list(self._buckets[level][series])
+        bucket = self._openBucket(level, series)
+        if bucket is not None:
+            buckets.append(bucket)
+        buckets = buckets[-max(1, (samples + size - 1) // size):]
+
+        if len(buckets) <= columns:
+            return buckets
+
+        # Fold neighbouring buckets into columns
+        result = []
+        count = len(buckets)
+        for c in range(columns):
+            chunk = buckets[c * count // columns:(c + 1) * count // columns]
+            result.append((min(b[0] for b in chunk), max(b[1] for b in chunk)))
+        return result
@@ -0,0 +1,37 @@
+"""
+TextCache is a bounded LRU cache of rendered text surfaces, keyed by
+(font, text, color). Text that didn't change since the last frame costs a
+dictionary lookup instead of a FreeType rasterization.
+"""
+
+from collections import OrderedDict
+
+
+class TextCache(object):
+    """
+    @var hits: renders answered from the cache
+    @var misses: renders that had to be rasterized
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._surfaces = OrderedDict()
+
+    def render(self, font, text, color):
+        """Same as font.render(text, 1, color), but cached."""
+        key = (font, text, tuple(color))
+
+        surface = self._surfaces.pop(key, None)
+        if surface is None:
+            self.misses += 1
+            surface = font.render(text, 1, color)
+            if len(self._surfaces) >= self.maxsize:
+                # Drop the least recently used text
+                self._surfaces.popitem(last=False)
+        else:
+            self.hits += 1
+
+        self._surfaces[key] = surface
+        return surface
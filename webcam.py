@@ -0,0 +1,181 @@
+"""
+Webcam keeps the latest snapshot of a printer's webcam ready to blit, for
+the Camera screen. One thread downloads a snapshot at most every interval
+seconds, another decodes it and scales it to the display size in the
+display's pixel format, so the main loop only ever blits a finished frame.
+Snapshots go through a connection of their own, never through the pool the
+state polls use, and nothing is fetched while the Camera screen is hidden.
+"""
+
+import time
+import threading
+import requests
+import pygame
+from StringIO import StringIO
+
+
+class Webcam(object):
+    """
+    @var url: snapshot url, e.g. http://octopi.local/webcam/?action=snapshot
+    @var interval: seconds from the start of one snapshot download to the next
+    @var frame: latest decoded snapshot, a surface of the size asked for by show(), or None
+    @var frameNumber: increases by one every time frame is replaced
+    @var frameTime: time the snapshot in frame was downloaded
+    @var error: why the last snapshot couldn't be shown, or None
+    @var dropped: downloaded snapshots replaced by a newer one before they were decoded
+    """
+
+    def __init__(self, url, interval=1.0, timeout=5.0, name="Webcam"):
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+
+        self.frame = None
+        self.frameNumber = 0
+        self.frameTime = 0.0
+        self.error = None
+        self.dropped = 0
+
+        # Size and pixel format frames are decoded to, set by show()
+        self._size = None
+        self._like = None
+        self._showing = False
+
+        # Latest downloaded snapshot waiting to be decoded, (time, data) or None
+        self._lock = threading.Lock()
+        self._pending = None
+        self._pendingEvent = threading.Event()
+
+        self._wakeEvent = threading.Event()
+        self._stopped = False
+
+        # Not the printer's session, a slow camera must never hold up a poll
+        self._session = requests.Session()
+
+        self._fetcher = threading.Thread(target=self._fetchLoop, name=name + " fetch")
+        self._fetcher.daemon = True
+        self._decoder = threading.Thread(target=self._decodeLoop, name=name + " decode")
+        self._decoder.daemon = True
+
+        # Optional PerfStats, downloads are recorded as "webcam_fetch" and decoding as "webcam_decode"
+        self.perf = None
+
+        # Optional callable, called on the decoding thread whenever frame or error changed
+        self.listener = None
+
+    def start(self):
+        self._fetcher.start()
+        self._decoder.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeEvent.set()
+        self._pendingEvent.set()
+        self._session.close()
+
+    def show(self, size, like=None):
+        """Start fetching snapshots, decoded to size and the pixel format of the surface like."""
+        if size != self._size:
+            self.frame = None
+        self._size = size
+        self._like = like
+        self._showing = True
+        self._wakeEvent.set()
+
+    def hide(self):
+        """Stop fetching snapshots, the last frame is kept."""
+        self._showing = False
+
+    def _fetchLoop(self):
+        while not self._stopped:
+            if not self._showing:
+                self._wakeEvent.wait()
+                self._wakeEvent.clear()
+                continue
+
+            started = time.time()
+            self._fetch()
+
+            # Throttled, however fast the camera answers
+            self._wakeEvent.wait(max(0.0, started + self.interval - time.time()))
+            self._wakeEvent.clear()
+
+    def _fetch(self):
+        start = time.time()
+        try:
+            req = self._session.get(self.url, timeout=self.timeout)
+            if req.status_code != 200:
+                self._failed("HTTP {0}".format(req.status_code))
+                return
+            data = req.content
+        except requests.exceptions.RequestException as e:
+            self._failed(str(e))
+            return
+
+        if self.perf is not None:
+            self.perf.record("webcam_fetch", (time.time() - start) * 1000.0)
+
+        # Only the newest snapshot is worth decoding
+        with self._lock:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (start, data)
+        self._pendingEvent.set()
+
+    def _decodeLoop(self):
+        while not self._stopped:
+            self._pendingEvent.wait()
+            self._pendingEvent.clear()
+
+            with self._lock:
+                pending = self._pending
+                self._pending = None
+            if pending is None or self._stopped:
+                continue
+
+            start = time.time()
+            try:
+                frame = self._decode(pending[1], self._size, self._like)
+            except pygame.error as e:
+                self._failed("Bad snapshot: {0}".format(e))
+                continue
+
+            if self.perf is not None:
+                self.perf.record("webcam_decode", (time.time() - start) * 1000.0)
+
+            self.frame = frame
+            self.frameTime = pending[0]
+            self.frameNumber += 1
+            self.error = None
+            self._publish()
+
+    def _decode(self, data, size, like):
+        """The snapshot scaled to fit size, centered on black, in the pixel format of like."""
+        image = pygame.image.load(StringIO(data), "snapshot.jpg")
+        width, height = image.get_size()
+        scale = min(float(size[0]) / width, float(size[1]) / height)
+        scaled = (max(1, int(width * scale)), max(1, int(height * scale)))
+
+        # smoothscale only handles 24 and 32 bit images
+        if image.get_bitsize() in (24, 32):
+            image = pygame.transform.smoothscale(image, scaled)
+        else:
+            image = pygame.transform.scale(image, scaled)
+
+        if like is not None:
+            frame = pygame.Surface(size, 0, like)
+        else:
+            frame = pygame.Surface(size)
+        frame.fill((0, 0, 0))
+        frame.blit(image, ((size[0] - scaled[0]) // 2, (size[1] - scaled[1]) // 2))
+        return frame
+
+    def _failed(self, error):
+        if error != self.error:
+            print "Webcam {0}: {1}".format(self.url, error)
+        self.error = error
+        self._publish()
+
+    def _publish(self):
+        if self.listener is not None:
+            self.listener()
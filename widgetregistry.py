@@ -0,0 +1,71 @@
+"""
+WidgetRegistry routes mouse events to the widgets of one screen through a
+spatial index. The screen is split into square cells, each listing the
+widgets overlapping it, so finding the widget under a touch looks at a
+single cell instead of asking every widget. A dispatch table maps each
+widget to the action its click runs.
+"""
+
+from pygame.locals import MOUSEMOTION, MOUSEBUTTONUP, MOUSEBUTTONDOWN
+
+MOUSE_EVENTS = (MOUSEMOTION, MOUSEBUTTONUP, MOUSEBUTTONDOWN)
+
+
+class WidgetRegistry(object):
+    """
+    @var widgets: registered widgets in the order they were added
+    @var cellSize: width and height in pixels of a cell of the index
+    """
+
+    def __init__(self, cellSize=32):
+        self.cellSize = cellSize
+        self.widgets = []
+        self._actions = {}
+        self._cells = {}  # (column, row) -> widgets overlapping that cell
+
+        # Pressed or hovered widgets, they must see the next mouse event to let go
+        self._engaged = []
+
+    def add(self, widget, action):
+        """Register widget, action is called without arguments when it's clicked."""
+        self.widgets.append(widget)
+        self._actions[widget] = action
+        self._index(widget)
+
+    def _index(self, widget):
+        rect = widget.rect
+        for column in range(rect.left // self.cellSize, (rect.right - 1) // self.cellSize + 1):
+            for row in range(rect.top // self.cellSize, (rect.bottom - 1) // self.cellSize + 1):
+                self._cells.setdefault((column, row), []).append(widget)
+
+    def widgetAt(self, pos):
+        """The first registered visible widget at pos, or None."""
+        for widget in self._cells.get((pos[0] // self.cellSize, pos[1] // self.cellSize), ()):
+            if widget.visible and widget.rect.collidepoint(pos):
+                return widget
+        return None
+
+    def dispatch(self, event):
+        """
+        Offer a mouse event to the widget under it, and to the widgets still
+        pressed or hovered from earlier events. Runs the action of a clicked
+        widget, returns True if one ran.
+        """
+        if event.type not in MOUSE_EVENTS:
+            return False
+
+        targets = list(self._engaged)
+        widget = self.widgetAt(event.pos)
+        if widget is not None and widget not in targets:
+            targets.append(widget)
+
+        clicked = False
+        self._engaged = []
+        for target in targets:
+            if 'click' in target.handleEvent(event):
+                self._actions[target]()
+                clicked = True
+
+            if target.visible and (target.buttonDown or target.mouseOverButton or target.lastMouseDownOverButton):
+                self._engaged.append(target)
+        return clicked